@@ -0,0 +1,90 @@
+"""Bundle Output Benchmark
+
+Compares per-site configuration files with bundled shard files: time to
+write all sites, time to refresh a single site and the number of files
+Apache has to open on startup.
+
+    py benchmarks/bench_bundle.py [--sites N] [--shards N]
+"""
+import argparse, json, os, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def sandbox(sites, shards):
+    """Create sandbox configuration with given number of sites
+
+    Arguments:
+        sites {int} -- number of sites
+        shards {int} -- bundle shards, 0 for per-site files
+
+    Returns:
+        tuple -- (sandbox directory, Config)
+    """
+    from vhoster.config import Config
+
+    root = tempfile.mkdtemp()
+    os.environ['XDG_CONFIG_HOME'] = os.environ['APPDATA'] = os.path.join(root, 'appdata')
+    for name in ['hosts', 'httpd-vhosts.conf']:
+        with open(os.path.join(root, name), 'w') as f:
+            f.write('')
+    os.makedirs(os.path.join(root, 'www'))
+    with open(os.path.join(root, 'config.json'), 'w') as f:
+        json.dump({
+            'dns': {'file': os.path.join(root, 'hosts')},
+            'apache': {
+                'conf': os.path.join(root, 'httpd-vhosts.conf'),
+                'sites': os.path.join(root, 'conf'),
+                'certs': os.path.join(root, 'certs'),
+                'bundle': shards
+            },
+            'sites': [{'domain': 'site%d.test' % i, 'path': os.path.join(root, 'www'), 'root': '', 'secure': False, 'mirrors': []} for i in range(sites)]
+        }, f)
+    return root, Config(os.path.join(root, 'config.json'))
+
+
+def measure(sites, shards):
+    from vhoster.site import Site
+    from vhoster.transaction import Transaction
+
+    root, config = sandbox(sites, shards)
+    try:
+        site = Site(config, id=0)
+        start = time.perf_counter()
+        with Transaction(config):
+            for s in site.list():
+                s.save(force=True)
+        full = time.perf_counter() - start
+
+        start = time.perf_counter()
+        site.save(force=True)
+        single = time.perf_counter() - start
+
+        files = len(os.listdir(os.path.join(root, 'conf')))
+        return full, single, files
+    finally:
+        shutil.rmtree(root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sites', type=int, default=2000)
+    parser.add_argument('--shards', type=int, default=16)
+    options = parser.parse_args()
+
+    results = []
+    for shards in [0, options.shards]:
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            results.append((shards,) + measure(options.sites, shards))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    print('%8s %14s %14s %8s' % ('shards', 'all (ms)', 'one site (ms)', 'files'))
+    for shards, full, single, files in results:
+        print('%8s %14.1f %14.2f %8d' % (shards or 'off', full * 1e3, single * 1e3, files))
+
+
+if __name__ == '__main__':
+    main()
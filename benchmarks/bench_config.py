@@ -0,0 +1,68 @@
+"""Configuration Load Benchmark
+
+Compares cold (JSON parse) and warm (binary sidecar) `Config` loads for
+configurations with 1k, 10k and 50k sites.
+
+    py benchmarks/bench_config.py
+"""
+import json, os, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from vhoster.config import Config
+
+SIZES = [1000, 10000, 50000]
+ROUNDS = 5
+
+
+def generate(path, size):
+    """Write configuration file with given number of sites
+
+    Arguments:
+        path {str} -- path to configuration file
+        size {int} -- number of sites
+    """
+    with open(path, 'w') as f:
+        json.dump({
+            'dns': {'file': '/etc/hosts'},
+            'apache': {'conf': '/etc/apache2/httpd-vhosts.conf'},
+            'sites': [{
+                'domain': 'site%d.test' % i,
+                'path': '/srv/www/site%d' % i,
+                'root': 'public',
+                'secure': bool(i % 2),
+                'mirrors': ['mirror%d.test' % i, 'alias%d.test:8080' % i]
+            } for i in range(size)]
+        }, f, indent=4)
+
+
+def measure(path, cold):
+    best = None
+    for _ in range(ROUNDS):
+        if cold and os.path.exists(path + '.cache'):
+            os.unlink(path + '.cache')
+        start = time.perf_counter()
+        Config(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        print('%8s %10s %12s %12s %9s' % ('sites', 'size (MB)', 'cold (ms)', 'warm (ms)', 'speedup'))
+        for size in SIZES:
+            path = os.path.join(directory, 'config-%d.json' % size)
+            generate(path, size)
+            cold = measure(path, True)
+            Config(path)
+            warm = measure(path, False)
+            print('%8d %10.2f %12.2f %12.2f %8.2fx' % (
+                size, os.path.getsize(path) / 1e6, cold * 1e3, warm * 1e3, cold / warm))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
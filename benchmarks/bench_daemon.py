@@ -0,0 +1,112 @@
+"""Daemon Benchmark
+
+Compares parks per minute of separate CLI processes with and without the
+command daemon running.
+
+    py benchmarks/bench_daemon.py [--sites N]
+"""
+import argparse, json, os, shutil, subprocess, sys, tempfile, time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+# The platform check is bypassed so that commands do their work on any OS
+RUNNER = '''
+import sys, vhoster.helpers
+vhoster.helpers.os_supported = lambda: True
+from vhoster.daemon import run
+run(sys.argv[1:])
+'''
+
+DAEMON = '''
+import vhoster.helpers
+vhoster.helpers.os_supported = lambda: True
+from vhoster.daemon import Daemon
+Daemon().serve()
+'''
+
+
+def sandbox():
+    """Create empty sandbox configuration
+
+    Returns:
+        str -- sandbox directory
+    """
+    root = tempfile.mkdtemp()
+    os.environ['XDG_CONFIG_HOME'] = os.environ['APPDATA'] = os.path.join(root, 'appdata')
+    os.environ['PYTHONPATH'] = ROOT + os.pathsep + os.environ.get('PYTHONPATH', '')
+    os.environ.pop('VHOSTER_NO_DAEMON', None)
+    for name in ['hosts', 'httpd-vhosts.conf']:
+        with open(os.path.join(root, name), 'w') as f:
+            f.write('')
+
+    # Apache stand-in that accepts every command
+    if os.name == 'nt':
+        apache = os.path.join(root, 'httpd.bat')
+        with open(apache, 'w') as f:
+            f.write('@exit /b 0\n')
+    else:
+        apache = os.path.join(root, 'httpd')
+        with open(apache, 'w') as f:
+            f.write('#!/bin/sh\nexit 0\n')
+        os.chmod(apache, 0o755)
+
+    from vhoster.helpers import app_data
+    with open(app_data('config.json'), 'w') as f:
+        json.dump({
+            'dns': {'file': os.path.join(root, 'hosts')},
+            'apache': {
+                'bin': apache,
+                'conf': os.path.join(root, 'httpd-vhosts.conf'),
+                'sites': os.path.join(root, 'conf'),
+                'certs': os.path.join(root, 'certs')
+            },
+            'sites': []
+        }, f)
+    return root
+
+
+def park(root, prefix, count, env):
+    """Park sites with one CLI process each
+
+    Returns:
+        float -- parks per minute
+    """
+    start = time.perf_counter()
+    for i in range(count):
+        path = os.path.join(root, 'www', '%s%d' % (prefix, i))
+        os.makedirs(path)
+        subprocess.run([sys.executable, '-c', RUNNER, 'park', '%s%d.test' % (prefix, i)],
+                       cwd=path, env=env, stdout=subprocess.DEVNULL, check=True)
+    return count / (time.perf_counter() - start) * 60
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sites', type=int, default=50)
+    options = parser.parse_args()
+
+    root = sandbox()
+    daemon = None
+    try:
+        standalone = park(root, 'local', options.sites, dict(os.environ, VHOSTER_NO_DAEMON='1'))
+
+        from vhoster.daemon import status
+        daemon = subprocess.Popen([sys.executable, '-c', DAEMON], cwd=ROOT, stdout=subprocess.DEVNULL)
+        while not status():
+            time.sleep(0.1)
+        daemonized = park(root, 'daemon', options.sites, dict(os.environ))
+
+        print('%12s %16s' % ('mode', 'parks / minute'))
+        print('%12s %16.0f' % ('standalone', standalone))
+        print('%12s %16.0f' % ('daemon', daemonized))
+    finally:
+        if daemon is not None:
+            from vhoster.daemon import call
+            call('shutdown')
+            daemon.wait()
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Key Generation Benchmark
+
+Measures key generation and signing latency per key algorithm, and the
+latency of signing with a key taken from the pre-generated key pool.
+
+    py benchmarks/bench_keygen.py [--rounds N]
+"""
+import argparse, os, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def timed(func, rounds):
+    """Return average run time of func
+
+    Arguments:
+        func {callable}
+        rounds {int}
+
+    Returns:
+        tuple -- (average seconds, last result)
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = func()
+    return (time.perf_counter() - start) / rounds, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    options = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    os.environ['XDG_CONFIG_HOME'] = os.environ['APPDATA'] = root
+    try:
+        from vhoster.certificate import CertificateAuthority
+        from vhoster.keys import ALGORITHMS, KeyPool, generate_key
+        from vhoster.truststore import FileTrustStore
+
+        authority = CertificateAuthority(os.path.join(root, 'ca'), store=FileTrustStore(os.path.join(root, 'trust.json')))
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            authority.ensure().load()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+        print('%12s %12s %12s %14s %16s' % ('algorithm', 'keygen (ms)', 'sign (ms)', 'total (ms)', 'pooled (ms)'))
+        for algorithm in ALGORITHMS:
+            keygen, key = timed(lambda: generate_key(algorithm), options.rounds)
+            sign, _ = timed(lambda: authority.issue('bench.test', key.public_key()), options.rounds)
+
+            pool = KeyPool(algorithm, options.rounds, os.path.join(root, 'pool'))
+            pool.fill()
+            pooled, _ = timed(lambda: authority.issue('bench.test', pool.take().public_key()), options.rounds)
+
+            print('%12s %12.2f %12.2f %14.2f %16.2f' % (
+                algorithm, keygen * 1e3, sign * 1e3, (keygen + sign) * 1e3, pooled * 1e3))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
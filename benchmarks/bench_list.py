@@ -0,0 +1,56 @@
+"""Site Listing Benchmark
+
+Measures `Site.list()` and `Site.links()` as the store grows. Cost per
+site should stay constant (linear total) up to 10k sites and beyond.
+
+    py benchmarks/bench_list.py
+"""
+import os, sys, time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from vhoster.config import Config
+from vhoster.site import Site
+
+SIZES = [100, 1000, 10000, 50000]
+
+
+def populate(size):
+    """Create an in-memory configuration with given number of sites
+
+    Arguments:
+        size {int} -- number of sites
+
+    Returns:
+        Config
+    """
+    config = Config()
+    config.set('sites', [{
+        'domain': 'site%d.test' % i,
+        'path': os.path.abspath('/srv/www/site%d' % (i // 2)),
+        'root': 'public' if i % 3 else '',
+        'secure': bool(i % 2),
+        'mirrors': ['mirror%d.test' % i]
+    } for i in range(size)])
+    return config
+
+
+def main():
+    print('%8s %12s %14s %12s' % ('sites', 'list (ms)', 'per site (us)', 'links (us)'))
+    for size in SIZES:
+        site = Site(populate(size), path='/srv/www/site0')
+
+        start = time.perf_counter()
+        sites = site.list()
+        listed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        site.links()
+        linked = time.perf_counter() - start
+
+        assert len(sites) == size
+        print('%8d %12.2f %14.3f %12.2f' % (size, listed * 1e3, listed / size * 1e6, linked * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""CLI Startup Benchmark
+
+Runs common read-only commands through the installed entry point
+(`vhoster.daemon:run`) under `python -X importtime`, against a sandbox
+configuration, and fails when a command fails, when the median of its total
+import time exceeds the budget or when heavy modules that are only needed by
+mutating commands get imported.
+
+    py benchmarks/bench_startup.py [--budget MILLISECONDS] [--repeat N] [--sites N]
+"""
+import argparse, json, os, re, shutil, statistics, subprocess, sys, tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+COMMANDS = [
+    ['--version'],
+    ['list'],
+    ['show'],
+    ['config', 'path']
+]
+
+FORBIDDEN = ['cryptography', 'pyngrok']
+
+# The platform check is bypassed so that commands do their work on any OS
+RUNNER = '''
+import sys, vhoster.helpers
+vhoster.helpers.os_supported = lambda: True
+from vhoster.daemon import run
+run(sys.argv[1:])
+'''
+
+
+def sandbox(sites):
+    """Create sandbox application data with registered sites
+
+    Arguments:
+        sites {int} -- number of sites
+
+    Returns:
+        str -- sandbox directory
+    """
+    root = tempfile.mkdtemp()
+    os.environ['XDG_CONFIG_HOME'] = os.environ['APPDATA'] = os.path.join(root, 'appdata')
+    os.environ['PYTHONPATH'] = ROOT + os.pathsep + os.environ.get('PYTHONPATH', '')
+    os.environ.pop('VHOSTER_NO_DAEMON', None)
+    paths = [os.path.join(root, 'www', 'site%d' % i) for i in range(max(sites, 1))]
+    for path in paths:
+        os.makedirs(path)
+
+    from vhoster.helpers import app_data
+    with open(app_data('config.json'), 'w') as f:
+        json.dump({
+            'dns': {'file': os.path.join(root, 'hosts')},
+            'apache': {'conf': os.path.join(root, 'httpd-vhosts.conf'), 'sites': os.path.join(root, 'conf')},
+            'sites': [{'domain': 'site%d.test' % i, 'path': path, 'root': '', 'secure': False, 'mirrors': []}
+                      for i, path in enumerate(paths)]
+        }, f)
+    return root
+
+
+def profile(args, cwd):
+    """Run CLI command and collect import times
+
+    Arguments:
+        args {list} -- command arguments
+        cwd {str} -- working directory
+
+    Returns:
+        tuple -- (exit code, {module: self time in microseconds})
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', RUNNER] + args,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, cwd=cwd
+    )
+    modules = {}
+    for line in proc.stderr.decode().splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+\d+ \|\s+(.+)$', line)
+        if match:
+            modules[match.group(2).strip()] = int(match.group(1))
+    return proc.returncode, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget', type=float, default=150.0, help='median import time budget per command (ms)')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per command')
+    parser.add_argument('--sites', type=int, default=20, help='registered sites')
+    options = parser.parse_args()
+
+    root = sandbox(options.sites)
+    cwd = os.path.join(root, 'www', 'site0')
+    failed = False
+    try:
+        for args in COMMANDS:
+            totals, heavy, codes = [], set(), set()
+            for _ in range(max(options.repeat, 1)):
+                code, modules = profile(args, cwd)
+                codes.add(code)
+                totals.append(sum(modules.values()) / 1000)
+                heavy.update(m for m in modules if m.split('.')[0] in FORBIDDEN)
+            total = statistics.median(totals)
+            problems = (['exit %d' % code for code in sorted(codes) if code]
+                        + (['imports %s' % ', '.join(sorted(heavy))] if heavy else []))
+            status = 'ok'
+            if total > options.budget or problems:
+                status = 'FAIL'
+                failed = True
+            print('%-16s %8.1f ms  %s%s' % (' '.join(args), total, status, (' (%s)' % '; '.join(problems)) if problems else ''))
+    finally:
+        shutil.rmtree(root)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Site Store Lookup Benchmark
+
+Measures `SiteStore` domain, path and mirror lookups as the store grows.
+Lookup cost should stay flat from 10 to 100k sites.
+
+    py benchmarks/bench_store.py
+"""
+import os, sys, timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from vhoster.config import Config
+from vhoster.site import SiteStore
+
+SIZES = [10, 100, 1000, 10000, 100000]
+LOOKUPS = 10000
+
+
+def populate(size):
+    """Create an in-memory store with given number of sites
+
+    Arguments:
+        size {int} -- number of sites
+
+    Returns:
+        SiteStore
+    """
+    config = Config()
+    config.set('sites', [{
+        'domain': 'site%d.test' % i,
+        'path': os.path.abspath('/srv/www/site%d' % i),
+        'root': '',
+        'secure': False,
+        'mirrors': ['mirror%d.test' % i]
+    } for i in range(size)])
+    return SiteStore(config)
+
+
+def main():
+    print('%8s %14s %14s %14s' % ('sites', 'domain (us)', 'path (us)', 'mirror (us)'))
+    for size in SIZES:
+        store = populate(size)
+        last = size - 1
+        path = os.path.abspath('/srv/www/site%d' % last)
+        timings = [
+            timeit.timeit(lambda: store.find(domain='site%d.test' % last), number=LOOKUPS),
+            timeit.timeit(lambda: store.find(path=path), number=LOOKUPS),
+            timeit.timeit(lambda: store.findMirror('mirror%d.test' % last), number=LOOKUPS)
+        ]
+        print('%8d %14.3f %14.3f %14.3f' % (size, *[t / LOOKUPS * 1e6 for t in timings]))
+
+
+if __name__ == '__main__':
+    main()
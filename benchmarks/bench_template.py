@@ -0,0 +1,62 @@
+"""Template Rendering Benchmark
+
+Renders `site.conf` for 10k sites, parsing the template on every call
+(previous behavior) versus using the compiled template cache.
+
+    py benchmarks/bench_template.py
+"""
+import os, sys, time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from importlib_resources import read_text
+from pyratemp import Template
+from vhoster import templates
+from vhoster.helpers import compile_template, parse_host, template
+
+SITES = 10000
+
+
+def context(i):
+    """Return template substitutions for site
+
+    Arguments:
+        i {int} -- site number
+
+    Returns:
+        dict
+    """
+    return dict(
+        domain='site%d.test' % i,
+        url='https://site%d.test' % i,
+        path='/srv/www/site%d' % i,
+        cert='/srv/certs/site%d.test.crt' % i,
+        certkey='/srv/certs/site%d.test.key' % i,
+        secure=bool(i % 2),
+        port=None,
+        mirrors=['mirror%d.test' % i]
+    )
+
+
+def uncached(name, **substitutions):
+    return Template(read_text(templates, name))(**substitutions, f={'parse_host': parse_host})
+
+
+def measure(render):
+    start = time.perf_counter()
+    for i in range(SITES):
+        render('site.conf', **context(i))
+    return time.perf_counter() - start
+
+
+def main():
+    compile_template('site.conf')
+    parsed = measure(uncached)
+    cached = measure(template)
+    print('%-10s %10.3fs' % ('uncached', parsed))
+    print('%-10s %10.3fs' % ('cached', cached))
+    print('%-10s %10.2fx' % ('speedup', parsed / cached))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Concurrent Park Stress Test
+
+Spawns N processes that park sites into the same configuration, hosts
+file and vhosts file at once, then checks that no registration was lost.
+
+    py benchmarks/stress_park.py [--processes N] [--sites M]
+"""
+import argparse, json, multiprocessing, os, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from vhoster.hosts import HostsFile
+
+
+def park(worker, sites, root):
+    """Park sites from a separate process
+
+    Arguments:
+        worker {int} -- worker number
+        sites {int} -- sites to park
+        root {str} -- sandbox directory
+    """
+    from vhoster.config import Config
+    from vhoster.site import Site
+    from vhoster.transaction import Transaction
+
+    config = Config(os.path.join(root, 'config.json'))
+    for i in range(sites):
+        path = os.path.join(root, 'www', 'w%d-%d' % (worker, i))
+        os.makedirs(path, exist_ok=True)
+        with config.locked():
+            with Transaction(config):
+                site = Site(config, domain='w%d-%d.test' % (worker, i))
+                site.path = path
+                site.save()
+
+
+def sandbox():
+    """Create sandbox configuration and system files
+
+    Returns:
+        str -- sandbox directory
+    """
+    root = tempfile.mkdtemp()
+    os.environ['XDG_CONFIG_HOME'] = os.path.join(root, 'appdata')
+    os.environ['APPDATA'] = os.environ['LOCALAPPDATA'] = os.path.join(root, 'appdata')
+    for name in ['hosts', 'httpd-vhosts.conf']:
+        with open(os.path.join(root, name), 'w') as f:
+            f.write('')
+    with open(os.path.join(root, 'config.json'), 'w') as f:
+        json.dump({
+            'dns': {'file': os.path.join(root, 'hosts')},
+            'apache': {
+                'conf': os.path.join(root, 'httpd-vhosts.conf'),
+                'sites': os.path.join(root, 'conf'),
+                'certs': os.path.join(root, 'certs')
+            },
+            'sites': []
+        }, f)
+    return root
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--sites', type=int, default=25, help='sites parked per process')
+    options = parser.parse_args()
+
+    root = sandbox()
+    try:
+        start = time.perf_counter()
+        workers = [multiprocessing.Process(target=park, args=(i, options.sites, root)) for i in range(options.processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        expected = options.processes * options.sites
+        with open(os.path.join(root, 'config.json')) as f:
+            sites = len(json.load(f)['sites'])
+        hosts = len(HostsFile(os.path.join(root, 'hosts')).entries())
+        with open(os.path.join(root, 'httpd-vhosts.conf')) as f:
+            includes = len([line for line in f if line.startswith('Include')])
+
+        print('%d sites parked by %d processes in %.2fs (%.1f sites/sec)' % (expected, options.processes, elapsed, expected / elapsed))
+        print('config: %d, hosts entries: %d, includes: %d' % (sites, hosts, includes))
+        failed = sites != expected or hosts != expected or includes != expected
+        print('FAIL' if failed else 'OK')
+        sys.exit(1 if failed else 0)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -20,7 +20,7 @@ setup(
         'terminaltables'
     ],
     entry_points = {
-        'console_scripts': ['vhoster=vhoster.cli:main']
+        'console_scripts': ['vhoster=vhoster.daemon:run']
     },
     package_data={
         '': ['*.md', '*.txt', 'LICENSE', 'README', '*.ico'],
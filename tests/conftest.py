@@ -0,0 +1,43 @@
+import json
+from types import SimpleNamespace
+import pytest
+from click.testing import CliRunner
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Isolated application data, file trust store and sites directory
+
+    Yields:
+        SimpleNamespace -- {root: sandbox directory, cli: run command and return its output}
+    """
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path / 'xdg'))
+    monkeypatch.setenv('APPDATA', str(tmp_path / 'xdg'))
+    for directory in ['conf', 'certs', 'www/a']:
+        (tmp_path / directory).mkdir(parents=True)
+    (tmp_path / 'hosts').write_text('127.0.0.1 localhost\n')
+    (tmp_path / 'httpd-vhosts.conf').write_text('# vhosts\n')
+
+    from vhoster.helpers import app_data
+    with open(app_data('config.json'), 'w') as f:
+        json.dump({
+            'dns': {'file': str(tmp_path / 'hosts')},
+            'apache': {'bin': 'httpd', 'conf': str(tmp_path / 'httpd-vhosts.conf'),
+                       'sites': str(tmp_path / 'conf'), 'certs': str(tmp_path / 'certs')},
+            'certs': {'truststore': 'file', 'pool': 0},
+            'sites': []
+        }, f)
+
+    import vhoster.cli.core
+    from vhoster.server import Server
+    monkeypatch.setattr(vhoster.cli.core, 'os_supported', lambda: True)
+    monkeypatch.setattr(Server, 'deferred', lambda server: None)
+    monkeypatch.chdir(tmp_path / 'www' / 'a')
+
+    def cli(*args):
+        from vhoster.cli import main
+        result = CliRunner().invoke(main, list(args), catch_exceptions=False)
+        assert result.exit_code == 0, result.output
+        return result.output
+
+    yield SimpleNamespace(root=tmp_path, cli=cli)
@@ -0,0 +1,28 @@
+import os, stat
+from cryptography import x509
+from vhoster.certificate import CertificateAuthority
+
+
+def test_authority_key_is_private_and_names_are_constrained(app):
+    authority = CertificateAuthority(str(app.root / 'ca'))
+    authority.create()
+    cert, key = authority.load()
+
+    if os.name == 'posix':
+        assert stat.S_IMODE(os.stat(authority.keyPath).st_mode) == 0o600
+
+    assert cert.extensions.get_extension_for_class(x509.BasicConstraints).value.path_length == 0
+    permitted = cert.extensions.get_extension_for_class(x509.NameConstraints).value.permitted_subtrees
+    assert x509.DNSName('test') in permitted
+
+
+def test_status_does_not_save_index_in_dry_run(app):
+    app.cli('park', 'a.test')
+    app.cli('secure')
+    index = app.root / 'xdg' / 'vhoster' / 'certs' / 'index.json'
+    index.unlink()
+
+    assert 'a.test' in app.cli('--dry-run', 'certs', 'status')
+    assert not index.exists()
+    app.cli('certs', 'status')
+    assert index.exists()
@@ -0,0 +1,30 @@
+import os
+from vhoster.certindex import CertificateIndex
+
+
+def entry(path, sha1='AA'):
+    return {'path': os.path.abspath(path), 'sha1': sha1, 'trusted': False}
+
+
+def test_find_follows_records_and_forgets(app):
+    index = CertificateIndex(str(app.root / 'index.json'))
+    index.record('a.test', entry('a.crt'))
+    index.record('b.test', entry('b.crt'))
+    assert index.find('a.crt') == 'a.test'
+    assert index.find('b.crt') == 'b.test'
+
+    index.record('a.test', entry('c.crt', 'BB'))
+    assert index.find('a.crt') is None
+    assert index.find('c.crt') == 'a.test'
+
+    index.forget('b.test')
+    assert index.find('b.crt') is None
+
+
+def test_find_after_save_and_load(app):
+    index = CertificateIndex(str(app.root / 'index.json'))
+    index.record('a.test', entry('a.crt'))
+    index.save()
+
+    assert index.find('a.crt') == 'a.test'
+    assert CertificateIndex(str(app.root / 'index.json')).find('a.crt') == 'a.test'
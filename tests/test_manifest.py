@@ -0,0 +1,26 @@
+import vhoster.manifest
+from vhoster.config import Config
+from vhoster.helpers import app_data
+from vhoster.manifest import Manifest, hosts_lines
+from vhoster.site import Site
+
+
+def test_state_parses_each_shard_once(app, monkeypatch):
+    config = Config(app_data('config.json'))
+    config.set('apache.bundle', 2)
+    config.save()
+    for i in range(6):
+        (app.root / 'www' / str(i)).mkdir()
+        Site(config, 's%d.test' % i, str(app.root / 'www' / str(i))).save()
+
+    parsed = []
+    read_sections = vhoster.manifest.read_sections
+    monkeypatch.setattr(vhoster.manifest, 'read_sections', lambda path: parsed.append(path) or read_sections(path))
+    manifest = Manifest()
+    hosts = hosts_lines(str(app.root / 'hosts'))
+    sites = Site(config).list()
+    for site in sites:
+        manifest.record(site, hosts)
+
+    assert 0 < len(parsed) == len(set(parsed)) <= 2
+    assert not any(manifest.changed(site, hosts) for site in sites)
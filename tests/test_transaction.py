@@ -0,0 +1,30 @@
+import os
+import pytest
+from vhoster.config import Config
+from vhoster.helpers import app_data
+from vhoster.site import Site
+from vhoster.transaction import Transaction
+
+
+def test_commit_writes_site_files(app):
+    config = Config(app_data('config.json'))
+    with Transaction(config):
+        Site(config, 'a.test', str(app.root / 'www' / 'a')).save()
+
+    assert os.path.isfile(str(app.root / 'conf' / 'a.test.conf'))
+    assert 'a.test' in (app.root / 'hosts').read_text()
+    assert Config(app_data('config.json')).get('sites')[0]['domain'] == 'a.test'
+
+
+def test_failed_block_discards_changes(app):
+    config = Config(app_data('config.json'))
+    with pytest.raises(RuntimeError):
+        with Transaction(config):
+            Site(config, 'a.test', str(app.root / 'www' / 'a')).save()
+            raise RuntimeError('interrupted')
+
+    assert os.listdir(str(app.root / 'conf')) == []
+    assert (app.root / 'hosts').read_text() == '127.0.0.1 localhost\n'
+    assert (app.root / 'httpd-vhosts.conf').read_text() == '# vhosts\n'
+    assert Config(app_data('config.json')).get('sites') == []
+    assert Transaction.current() is None
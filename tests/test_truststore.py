@@ -0,0 +1,126 @@
+import json, os
+from datetime import datetime, timedelta
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.x509.oid import NameOID
+from vhoster.keys import generate_key
+from vhoster import truststore
+from vhoster.truststore import FileTrustStore, WindowsTrustStore, pem_fingerprint
+
+
+def self_signed(certPath, keyPath, domain):
+    """Write self-signed certificate, as created by earlier versions"""
+    key = generate_key('rsa-2048')
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, domain)])
+    cert = (
+        x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(datetime.utcnow())
+            .not_valid_after(datetime.utcnow() + timedelta(days=365))
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName(domain)]), critical=False)
+            .sign(key, hashes.SHA256(), default_backend())
+    )
+    with open(certPath, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(keyPath, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption()))
+
+
+def test_flush_applies_queued_changes(app):
+    certPath = str(app.root / 'certs' / 'one.crt')
+    self_signed(certPath, str(app.root / 'certs' / 'one.key'), 'one.test')
+    store = FileTrustStore(str(app.root / 'truststore.json'))
+
+    fingerprint = store.add(certPath)
+    assert len(store) == 1
+    assert store.fingerprints() == {}
+    assert store.flush() == {'one.crt': None}
+    assert store.fingerprints() == {fingerprint: certPath}
+    assert len(store) == 0
+
+    store.remove(fingerprint, 'one.crt')
+    assert store.flush() == {'one.crt': None}
+    assert store.fingerprints() == {}
+
+
+def test_remove_cancels_queued_add(app):
+    certPath = str(app.root / 'certs' / 'one.crt')
+    self_signed(certPath, str(app.root / 'certs' / 'one.key'), 'one.test')
+    store = FileTrustStore(str(app.root / 'truststore.json'))
+
+    store.remove(store.add(certPath))
+    store.flush()
+    assert store.fingerprints() == {}
+
+
+def test_trust_and_untrust_keep_queued_changes(app):
+    paths = {}
+    for name in ['one', 'two']:
+        paths[name] = str(app.root / 'certs' / ('%s.crt' % name))
+        self_signed(paths[name], str(app.root / 'certs' / ('%s.key' % name)), name + '.test')
+    store = FileTrustStore(str(app.root / 'truststore.json'))
+    one = store.add(paths['one'])
+
+    assert store.trust(paths['two']) is None
+    two = pem_fingerprint(paths['two'])
+    assert store.fingerprints() == {two: paths['two']}
+    assert len(store) == 1
+
+    assert store.flush() == {'one.crt': None}
+    assert store.untrust(one) is None
+    assert store.fingerprints() == {two: paths['two']}
+
+
+def test_migrate_untrusts_self_signed_certificate(app):
+    app.cli('park', 'a.test')
+    certPath, keyPath = str(app.root / 'certs' / 'a.test.crt'), str(app.root / 'certs' / 'a.test.key')
+    self_signed(certPath, keyPath, 'a.test')
+    old = pem_fingerprint(certPath)
+
+    store = FileTrustStore()
+    assert store.trust(certPath) is None
+    from vhoster.helpers import app_data
+    with open(app_data('config.json'), 'r') as f:
+        config = json.load(f)
+    config['sites'][0]['secure'] = True
+    with open(app_data('config.json'), 'w') as f:
+        json.dump(config, f)
+
+    output = app.cli('certs', 'migrate')
+
+    ca = pem_fingerprint(app_data('certs', 'ca.crt'))
+    assert store.fingerprints() == {ca: app_data('certs', 'ca.crt')}
+    assert 'Trust Store Updated: a.test.crt' in output
+    assert pem_fingerprint(certPath) != old
+
+    from vhoster.certindex import CertificateIndex
+    index = CertificateIndex()
+    assert index.get('a.test')['sha1'] == pem_fingerprint(certPath)
+    assert not index.get('a.test')['trusted']
+    assert index.get(index.find(app_data('certs', 'ca.crt')))['trusted']
+
+
+def test_windows_flush_runs_script_from_file(app, monkeypatch):
+    calls = []
+
+    def run_command(command, quiet=False, timeout=None):
+        with open(command[-1], encoding='utf-8-sig') as f:
+            script = f.read()
+        calls.append((command, script))
+        fingerprints = [line.split("'ok ")[1].split("'")[0] for line in script.splitlines() if "'ok " in line]
+        return {'output': '\n'.join('ok %s' % fingerprint for fingerprint in fingerprints), 'errors': ''}
+
+    monkeypatch.setattr(truststore, 'run_command', run_command)
+    store = WindowsTrustStore()
+    for i in range(1000):
+        store.remove(':'.join(['%040X' % i][0][j:j + 2] for j in range(0, 40, 2)), 'site%d.crt' % i)
+
+    results = store.flush()
+    assert len(results) == 1000 and not any(results.values())
+    (command, script), = calls
+    assert len(script) > 32767 and len(' '.join(command)) < 32767
+    assert not os.path.exists(command[-1])
@@ -0,0 +1,31 @@
+import os
+from vhoster.config import Config
+from vhoster.helpers import app_data
+from vhoster.site import Site
+from vhoster.watcher import PollingWatcher, SiteWatcher
+
+
+def test_missing_document_root_is_kept(app):
+    config = Config(app_data('config.json'))
+    site = Site(config, 'a.test', str(app.root / 'www' / 'a'))
+    site.root = 'public'
+    site.save()
+
+    public = str(app.root / 'www' / 'a' / 'public')
+    assert site.documentRoot() == public
+    assert 'DocumentRoot "%s"' % public in (app.root / 'conf' / 'a.test.conf').read_text()
+
+
+def test_watch_refreshes_site_when_document_root_appears(app, capsys):
+    config = Config(app_data('config.json'))
+    site = Site(config, 'a.test', str(app.root / 'www' / 'a'))
+    site.root = 'public'
+    site.save()
+    watcher = SiteWatcher(config, PollingWatcher(), debounce=0)
+    directory = str(app.root / 'www' / 'a')
+    assert 'Document root missing' in capsys.readouterr().out
+
+    assert watcher.refresh({directory}) == 0
+    os.makedirs(os.path.join(directory, 'public'))
+    assert watcher.refresh({directory}) == 1
+    assert 'Refreshing: a.test' in capsys.readouterr().out
@@ -1,8 +1,36 @@
 """Apache Virtual Host Manager"""
 from .helpers import *
 from .errors import *
-from .config import Config
-from .certificate import Certificate
-from .server import Server
-from .site import Site
-from .ngrok import Ngrok
\ No newline at end of file
+
+# Heavy modules (cryptography, pyngrok) are only imported on first access
+_LAZY = {
+    'Config': 'config',
+    'Certificate': 'certificate',
+    'CertificateAuthority': 'certificate',
+    'Server': 'server',
+    'Site': 'site',
+    'Transaction': 'transaction',
+    'Manifest': 'manifest',
+    'HostsFile': 'hosts',
+    'TrustStore': 'truststore',
+    'CertificateIndex': 'certindex',
+    'Daemon': 'daemon',
+    'Plan': 'plan',
+    'hosts_lines': 'manifest',
+    'Ngrok': 'ngrok'
+}
+
+__all__ = [name for name in list(globals()) if not name.startswith('_')] + list(_LAZY)
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        from importlib import import_module
+        value = getattr(import_module('.' + _LAZY[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY))
\ No newline at end of file
@@ -0,0 +1,167 @@
+import os, re, zlib
+from .helpers import *
+from .plan import Plan, read_text
+
+
+class Bundle:
+    """Bundled Apache Configuration
+
+    When `apache.bundle` is set to a number of shards, site configurations
+    are written as delimited sections of that many shard files, loaded by a
+    single `IncludeOptional` directive, instead of one file and `Include`
+    line per site. Each site always maps to the same shard, so changing a
+    site only rewrites its shard.
+
+    Arguments:
+        config {Config} -- configuration instance
+    """
+
+    def __init__(self, config):
+        self.shards = int(config.get('apache.bundle') or 0)
+        self.directory = os.path.abspath(config.get('apache.sites') or app_data('conf'))
+
+    @property
+    def enabled(self):
+        """Check if bundle output mode is enabled
+
+        Returns:
+            bool
+        """
+        return self.shards > 0
+
+    def include(self):
+        """Return directive including all shard files
+
+        Returns:
+            str
+        """
+        return 'IncludeOptional "%s"' % os.path.join(self.directory, 'vhosts-%d-*.conf' % self.shards)
+
+    def isStale(self, line):
+        """Check if line includes shard files of another shard count or a disabled bundle
+
+        Arguments:
+            line {str} -- apache configuration line
+
+        Returns:
+            bool
+        """
+        line = line.strip()
+        if self.enabled and line == self.include():
+            return False
+        pattern = r'^IncludeOptional "%s\d+-\*\.conf"$' % re.escape(os.path.join(self.directory, 'vhosts-'))
+        return re.match(pattern, line) is not None
+
+    def shardPath(self, name):
+        """Return path to shard file holding site configuration
+
+        Arguments:
+            name {str} -- site configuration name
+
+        Returns:
+            str
+        """
+        index = zlib.crc32(name.encode('utf-8')) % self.shards
+        return os.path.join(self.directory, 'vhosts-%d-%02d.conf' % (self.shards, index))
+
+    def prune(self):
+        """Remove shard files left over from another shard count or a disabled bundle
+
+        In dry-run mode, removals are added to the recording plan.
+
+        Returns:
+            list -- removed file names
+        """
+        removed = []
+        plan = Plan.recording()
+        current = 'vhosts-%d-' % self.shards if self.enabled else None
+        for name in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            if re.match(r'^vhosts-\d+-\d+\.conf$', name) and not (current and name.startswith(current)):
+                if plan is not None:
+                    plan.delete(os.path.join(self.directory, name))
+                else:
+                    os.remove(os.path.join(self.directory, name))
+                removed.append(name)
+        return removed
+
+    def section(self, name):
+        """Return site configuration section from its shard
+
+        Arguments:
+            name {str} -- site configuration name
+
+        Returns:
+            str -- None if site is not in bundle
+        """
+        return read_sections(self.shardPath(name)).get(name)
+
+    def render(self, original, changes: dict):
+        """Apply section changes to shard file content
+
+        Arguments:
+            original {str} -- current content, None if missing
+            changes {dict} -- {name: section content, or None to remove}
+
+        Returns:
+            str -- new content, None if no sections are left
+        """
+        previous = parse_sections(original or '')
+        sections = dict(previous)
+        for name, content in changes.items():
+            if content is None:
+                sections.pop(name, None)
+            else:
+                sections[name] = content.strip('\n')
+
+        if sections == previous:
+            return original
+        if not sections:
+            return None
+        return '\n\n'.join('# BEGIN %s\n%s\n# END %s' % (name, content, name) for name, content in sections.items()) + '\n'
+
+
+def config_name(confPath):
+    """Return site configuration name from its file path
+
+    Arguments:
+        confPath {str} -- path to site configuration file
+
+    Returns:
+        str
+    """
+    return os.path.splitext(os.path.basename(confPath))[0]
+
+
+def read_sections(path):
+    """Read site sections from shard file
+
+    Arguments:
+        path {str} -- path to shard file
+
+    Returns:
+        dict -- {name: section content}
+    """
+    return parse_sections(read_text(path) or '')
+
+
+def parse_sections(content):
+    """Parse site sections of shard file content
+
+    Arguments:
+        content {str} -- shard file content
+
+    Returns:
+        dict -- {name: section content}
+    """
+    sections = {}
+    name, body = None, []
+    for line in content.splitlines():
+        if name is None:
+            if line.startswith('# BEGIN '):
+                name, body = line[8:].strip(), []
+        elif line == '# END %s' % name:
+            sections[name] = '\n'.join(body)
+            name = None
+        else:
+            body.append(line)
+    return sections
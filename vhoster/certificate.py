@@ -1,11 +1,14 @@
 from cryptography import x509
-from cryptography.x509.oid import NameOID
+from cryptography.x509.oid import NameOID, ExtendedKeyUsageOID
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
 from datetime import datetime, timedelta
 from vhoster.helpers import *
+from vhoster.truststore import trust_store
+from vhoster.certindex import CertificateIndex, file_stamp
+from vhoster.keys import DEFAULT_ALGORITHM, KeyPool, generate_key, key_algorithm, key_bytes, key_type
+from concurrent.futures import ProcessPoolExecutor
 import os
 
 
@@ -14,56 +17,98 @@ class Certificate:
 
     Arguments:
         domain {str} -- domain name
+
+    Keyword Arguments:
+        store {TrustStore} -- trusted root certificate store (default: {None}, detected from the OS)
+        index {CertificateIndex} -- shared fingerprint index, saved by its owner (default: {None})
     """
 
-    def __init__(self, domain):
+    def __init__(self, domain, store=None, index=None):
         self.domain = domain
+        self.__store = store
+        self.__index = index
+        self.__ownIndex = index is None
+
+    @property
+    def store(self):
+        """Return trusted root certificate store
+
+        Returns:
+            TrustStore
+        """
+        if self.__store is None:
+            self.__store = trust_store()
+        return self.__store
+
+    @property
+    def index(self):
+        """Return certificate fingerprint index
+
+        Returns:
+            CertificateIndex
+        """
+        if self.__index is None:
+            self.__index = CertificateIndex()
+        return self.__index
+
+    def inspect(self, certPath):
+        """Return index entry of certificate, parsing the file only if not indexed or changed
 
-    def create(self, certPath, keyPath):
-        """Create SSL/TLS certificate
+        Certificates found on disk before they were indexed are assumed to
+        be trusted if self-signed, as earlier versions trusted each of them.
+
+        Arguments:
+            certPath {str} -- path to certificate file (.crt)
+
+        Returns:
+            dict -- None if file does not exist
+        """
+        domain = self.index.find(certPath)
+        entry = self.index.current(domain, certPath) if domain else None
+        if entry is None and os.path.isfile(certPath):
+            entry = read_entry(certPath)
+            if domain is None:
+                entry['trusted'] = entry['selfSigned']
+            self.index.record(domain or self.domain, entry)
+            self.__saveIndex()
+            entry = self.index.get(domain or self.domain)
+        return entry
+
+    def __saveIndex(self):
+        """Save index, unless it is shared with (and saved by) its owner"""
+        if self.__ownIndex:
+            self.index.save()
+
+    def create(self, certPath, keyPath, names=None, reuseKey=True, algorithm=None):
+        """Create SSL/TLS certificate signed by the local certificate authority
+
+        New keys are taken from the pre-generated key pool, if available.
 
         Arguments:
             certPath {str} -- path to store certificate file (.crt)
             keyPath {str} -- path to store certificate key (.key)
-        """
-        key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=1024,
-            backend=default_backend()
-        )
 
-        name = x509.Name([
-            x509.NameAttribute(NameOID.COMMON_NAME, self.domain)
-        ])
+        Keyword Arguments:
+            names {list} -- subject alternative names (default: {None}, domain and www alias)
+            reuseKey {bool} -- sign existing key at keyPath, if any (default: {True})
+            algorithm {str} -- key algorithm (default: {None}, DEFAULT_ALGORITHM)
 
-        alt_names = x509.SubjectAlternativeName([
-            x509.DNSName(self.domain),
-            x509.DNSName('www.%s' % self.domain)
-        ])
+        Returns:
+            dict -- certificate index entry
+        """
+        algorithm = key_algorithm(algorithm)
+        key = load_private_key(keyPath) if reuseKey else None
+        if key is None or key_type(key) != algorithm:
+            key = KeyPool(algorithm).take() or generate_key(algorithm)
+            write_private_key(keyPath, key)
 
-        cert = (
-            x509.CertificateBuilder()
-                .subject_name(name)
-                .issuer_name(name)
-                .public_key(key.public_key())
-                .serial_number(1000)
-                .not_valid_before(datetime.utcnow())
-                .not_valid_after(datetime.utcnow() + timedelta(days=10*365))
-                .add_extension(x509.BasicConstraints(ca=True, path_length=0), False)
-                .add_extension(alt_names, False)
-                .sign(key, hashes.SHA256(), default_backend())
-        )
+        cert = CertificateAuthority().issue(self.domain, key.public_key(), names)
 
         with open(certPath, 'wb') as f:
             f.write(cert.public_bytes(serialization.Encoding.PEM))
             info(os.path.basename(certPath), title='Certificate Created')
 
-        with open(keyPath, 'wb') as f:
-            f.write(key.private_bytes(
-                serialization.Encoding.PEM,
-                serialization.PrivateFormat.TraditionalOpenSSL,
-                serialization.NoEncryption()
-            ))
+        return index_entry(cert, certPath)
 
     def delete(self, certPath, keyPath):
         """Delete SSL/TLS certificate
@@ -77,44 +122,72 @@ class Certificate:
                 os.unlink(path)
                 info(os.path.basename(path), title='Deleted')
 
+        # Trusted entries are kept until untrusted, so they can be removed later
+        domain = self.index.find(certPath)
+        if domain is not None and not self.index.get(domain).get('trusted'):
+            self.index.forget(domain)
+            self.__saveIndex()
+
     def trust(self, certPath):
         """Add to trusted root certificates
 
         Arguments:
             certPath {str} -- path to certificate file (.crt)
         """
-        if not os.path.exists(certPath) and os.path.isfile(certPath):
-            error(certPath, 'File not found')
+        if not os.path.isfile(certPath):
+            error(certPath, title='File not found')
             return None
 
         fileName = os.path.basename(certPath)
-        command = run_command(
-            'certutil -addstore -f "ROOT" ' + repr(certPath), True)
+        err = self.store.trust(certPath, fileName)
 
-        if command['returncode'] == 0:
+        if err is None:
+            self.inspect(certPath)
+            self.index.setTrusted(self.index.find(certPath))
+            self.__saveIndex()
             info(fileName, title='Added to trusted certificates')
         else:
             error(fileName, title='Failed to add to trusted certificates')
-            warn('\n' + template('cmd.txt', **command))
+            warn(err)
 
     def untrust(self, certPath):
         """Remove from trusted root certificates
 
+        Uses the fingerprint index, so certificates can be untrusted after
+        their file was deleted.
+
         Arguments:
             certPath {str} -- path to certificate file (.crt)
         """
-        fingerprint = self.getFingerprint(certPath)
+        domain = self.index.find(certPath)
+        entry = self.index.get(domain) if domain else self.inspect(certPath)
 
-        if fingerprint:
+        if entry:
+            domain = self.index.find(certPath)
             fileName = os.path.basename(certPath)
-            command = run_command(
-                'certutil -delstore "ROOT" %s' % repr(fingerprint), True)
+            err = self.store.untrust(entry['sha1'], fileName)
 
-            if command['returncode'] == 0:
-                success(fileName, title='Added to trusted certificates')
+            if err is None:
+                self.index.setTrusted(domain, False)
+                if not os.path.isfile(certPath):
+                    self.index.forget(domain)
+                self.__saveIndex()
+                success(fileName, title='Removed from trusted certificates')
             else:
-                error(fileName, title='Failed to add to trusted certificates')
-                warn('\n' + template('cmd.txt', **command))
+                error(fileName, title='Failed to remove from trusted certificates')
+                warn(err)
+
+    def isSelfSigned(self, certPath):
+        """Check if certificate is its own root (created before the local certificate authority)
+
+        Arguments:
+            certPath {str} -- path to certificate file (.crt)
+
+        Returns:
+            bool
+        """
+        entry = self.inspect(certPath)
+        return bool(entry and entry['selfSigned'])
 
     def getFingerprint(self, certPath):
         """Get certificate fingerprint
@@ -125,11 +198,435 @@ class Certificate:
         Return:
             str -- certificate fingerprint encoded using SHA1
         """
-        if not os.path.exists(certPath):
-            return None
+        entry = self.inspect(certPath)
+        return entry['sha1'] if entry else None
+
+
+class CertificateAuthority:
+    """Local Root Certificate Authority
+
+    The root certificate is created and trusted once, then used to sign
+    the certificates of all sites. It cannot sign intermediate authorities
+    and is limited to the reserved local domains in PERMITTED.
+
+    Keyword Arguments:
+        path {str} -- directory to store authority files (default: {app_data('certs')})
+        store {TrustStore} -- trusted root certificate store (default: {None}, detected from the OS)
+    """
+
+    NAME = 'VHoster Local CA'
+
+    # Domains (and their subdomains) the root certificate may sign for
+    PERMITTED = ('test', 'localhost', 'local', 'example', 'invalid', 'internal', 'lan', 'home.arpa')
+
+    # Loaded root certificates and keys per directory, reused by long-running
+    # processes while the files are unchanged
+    LOADED = {}
+
+    def __init__(self, path=None, store=None):
+        self.path = path or app_data('certs')
+        self.store = store
+        self.__cert = None
+        self.__key = None
+
+    @property
+    def certPath(self):
+        """Return path to root certificate file
+
+        Returns:
+            str
+        """
+        return os.path.join(self.path, 'ca.crt')
+
+    @property
+    def keyPath(self):
+        """Return path to root certificate key file
+
+        Returns:
+            str
+        """
+        return os.path.join(self.path, 'ca.key')
+
+    def exists(self):
+        """Check if root certificate and key exist
+
+        Returns:
+            bool
+        """
+        return os.path.isfile(self.certPath) and os.path.isfile(self.keyPath)
+
+    def ensure(self):
+        """Create and trust root certificate, if missing
+
+        Returns:
+            CertificateAuthority
+        """
+        if not self.exists():
+            self.create()
+            Certificate(self.NAME, store=self.store).trust(self.certPath)
+        return self
+
+    def create(self):
+        """Create root certificate and key"""
+        os.makedirs(self.path, exist_ok=True)
+        key = generate_key('rsa-2048')
+
+        name = x509.Name([
+            x509.NameAttribute(NameOID.COMMON_NAME, self.NAME),
+            x509.NameAttribute(NameOID.ORGANIZATION_NAME, 'VHoster')
+        ])
+
+        cert = (
+            x509.CertificateBuilder()
+                .subject_name(name)
+                .issuer_name(name)
+                .public_key(key.public_key())
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(datetime.utcnow() - timedelta(days=1))
+                .not_valid_after(datetime.utcnow() + timedelta(days=10*365))
+                .add_extension(x509.BasicConstraints(ca=True, path_length=0), True)
+                .add_extension(x509.KeyUsage(
+                    digital_signature=False, content_commitment=False, key_encipherment=False,
+                    data_encipherment=False, key_agreement=False, key_cert_sign=True,
+                    crl_sign=True, encipher_only=False, decipher_only=False
+                ), True)
+                .add_extension(x509.NameConstraints(
+                    permitted_subtrees=[x509.DNSName(name) for name in self.PERMITTED],
+                    excluded_subtrees=None
+                ), True)
+                .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), False)
+                .sign(key, hashes.SHA256(), default_backend())
+        )
+
+        write_private_key(self.keyPath, key)
+        with open(self.certPath, 'wb') as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+            info(os.path.basename(self.certPath), title='Certificate Authority Created')
+
+        self.__cert, self.__key = cert, key
+
+    def load(self):
+        """Load root certificate and key
+
+        Returns:
+            tuple -- (certificate, private key)
+        """
+        if self.__cert is None:
+            self.ensure()
+            stamp = (file_stamp(self.certPath), file_stamp(self.keyPath))
+            cached = CertificateAuthority.LOADED.get(self.path)
+            if cached is not None and cached[0] == stamp:
+                self.__cert, self.__key = cached[1]
+            else:
+                with open(self.certPath, 'rb') as f:
+                    self.__cert = x509.load_pem_x509_certificate(f.read(), default_backend())
+                self.__key = load_private_key(self.keyPath)
+                CertificateAuthority.LOADED[self.path] = (stamp, (self.__cert, self.__key))
+        return self.__cert, self.__key
+
+    def issue(self, domain, publicKey, names=None, days=397):
+        """Sign leaf certificate for domain
+
+        Arguments:
+            domain {str} -- domain name
+            publicKey {PublicKey} -- leaf public key
+
+        Keyword Arguments:
+            names {list} -- subject alternative names (default: {None}, domain and www alias)
+            days {int} -- validity period (default: {397})
+
+        Returns:
+            Certificate -- x509 certificate
+        """
+        caCert, caKey = self.load()
+        names = names or [domain, 'www.%s' % domain]
+
+        try:
+            constraints = caCert.extensions.get_extension_for_class(x509.NameConstraints).value
+            permitted = [subtree.value for subtree in constraints.permitted_subtrees or ()]
+        except x509.ExtensionNotFound:
+            permitted = None
+        if permitted is not None:
+            for name in names:
+                if not any(name == tld or name.endswith('.' + tld) for tld in permitted):
+                    warn('%s is outside of %s, browsers will not trust it' % (name, ', '.join(permitted)),
+                         title='Certificate Name')
+
+        alt_names = x509.SubjectAlternativeName([x509.DNSName(name) for name in names])
+
+        return (
+            x509.CertificateBuilder()
+                .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, domain)]))
+                .issuer_name(caCert.subject)
+                .public_key(publicKey)
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(datetime.utcnow() - timedelta(days=1))
+                .not_valid_after(datetime.utcnow() + timedelta(days=days))
+                .add_extension(x509.BasicConstraints(ca=False, path_length=None), True)
+                .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]), False)
+                .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(caKey.public_key()), False)
+                .add_extension(alt_names, False)
+                .sign(caKey, hashes.SHA256(), default_backend())
+        )
+
+
+def load_private_key(keyPath):
+    """Load PEM encoded private key
+
+    Arguments:
+        keyPath {str} -- path to key file (.key)
+
+    Returns:
+        PrivateKey -- None if file does not exist
+    """
+    if not os.path.isfile(keyPath):
+        return None
+
+    with open(keyPath, 'rb') as f:
+        return serialization.load_pem_private_key(f.read(), None, default_backend())
+
+
+def write_private_key(keyPath, key):
+    """Write PEM encoded private key
+
+    Arguments:
+        keyPath {str} -- path to key file (.key)
+        key {PrivateKey} -- private key
+    """
+    fd = os.open(keyPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        os.chmod(keyPath, 0o600)
+        f.write(key_bytes(key))
+
+
+def create_certificate(domain, certPath, keyPath, names=None, algorithm=None):
+    """Create SSL/TLS certificate (process pool worker)
+
+    Arguments:
+        domain {str} -- domain name
+        certPath {str} -- path to store certificate file (.crt)
+        keyPath {str} -- path to store certificate key (.key)
+
+    Keyword Arguments:
+        names {list} -- subject alternative names (default: {None})
+        algorithm {str} -- key algorithm (default: {None}, DEFAULT_ALGORITHM)
+
+    Returns:
+        dict -- certificate index entry
+    """
+    return Certificate(domain).create(certPath, keyPath, names, algorithm=algorithm)
+
+
+def fingerprint(cert, algorithm):
+    """Return colon separated certificate fingerprint
+
+    Arguments:
+        cert {Certificate} -- x509 certificate
+        algorithm {HashAlgorithm} -- hash algorithm
+
+    Returns:
+        str
+    """
+    return ':'.join('{:02x}'.format(c) for c in cert.fingerprint(algorithm)).upper()
+
+
+def expiry_date(cert):
+    """Return certificate expiry date
+
+    Arguments:
+        cert {Certificate} -- x509 certificate
+
+    Returns:
+        datetime -- naive UTC date, as recorded in the index
+    """
+    expires = getattr(cert, 'not_valid_after_utc', None)
+    return expires.replace(tzinfo=None) if expires is not None else cert.not_valid_after
+
+
+def index_entry(cert, certPath):
+    """Return fingerprint index entry of certificate
+
+    Arguments:
+        cert {Certificate} -- x509 certificate
+        certPath {str} -- path to certificate file (.crt)
+
+    Returns:
+        dict
+    """
+    issuer = cert.issuer.get_attributes_for_oid(NameOID.COMMON_NAME)
+    return {
+        'path': os.path.abspath(certPath),
+        'sha1': fingerprint(cert, hashes.SHA1()),
+        'sha256': fingerprint(cert, hashes.SHA256()),
+        'serial': '{:X}'.format(cert.serial_number),
+        'expires': expiry_date(cert).isoformat(),
+        'issuer': issuer[0].value if issuer else '',
+        'selfSigned': cert.issuer == cert.subject,
+        'trusted': False,
+        'stamp': file_stamp(certPath)
+    }
+
+
+def read_entry(certPath):
+    """Parse certificate file into fingerprint index entry
+
+    Arguments:
+        certPath {str} -- path to certificate file (.crt)
+
+    Returns:
+        dict
+    """
+    with open(certPath, 'rb') as f:
+        return index_entry(x509.load_pem_x509_certificate(f.read(), default_backend()), certPath)
+
+
+class CertificateCache:
+    """Certificate Reuse Cache
+
+    Inspects existing certificates so that unchanged sites keep them
+    instead of generating new keys.
+
+    Keyword Arguments:
+        algorithm {str} -- expected key algorithm (default: {None}, DEFAULT_ALGORITHM)
+        minDays {int} -- minimum remaining validity in days (default: {30})
+    """
+
+    def __init__(self, algorithm=None, minDays=30):
+        self.algorithm = key_algorithm(algorithm)
+        self.minDays = minDays
+        self.hits = 0
+        self.misses = 0
+        self.__authority = None
+
+    def valid(self, certPath, keyPath, names):
+        """Check if existing certificate can be reused, counting hits and misses
+
+        Arguments:
+            certPath {str} -- path to certificate file (.crt)
+            keyPath {str} -- path to certificate key (.key)
+            names {list} -- expected subject alternative names
+
+        Returns:
+            bool
+        """
+        try:
+            reusable = self.__inspect(certPath, keyPath, names)
+        except Exception:
+            reusable = False
+
+        if reusable:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return reusable
+
+    def __inspect(self, certPath, keyPath, names):
+        if not os.path.isfile(certPath) or not os.path.isfile(keyPath):
+            return False
 
         with open(certPath, 'rb') as certFile:
-            cert = x509.load_pem_x509_certificate(
-                certFile.read(), default_backend())
-            fingerprint = cert.fingerprint(hashes.SHA1())
-            return ":".join("{:02x}".format(c) for c in fingerprint).upper()
+            cert = x509.load_pem_x509_certificate(certFile.read(), default_backend())
+
+        if expiry_date(cert) - datetime.utcnow() < timedelta(days=self.minDays):
+            return False
+
+        alt_names = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        if set(alt_names.get_values_for_type(x509.DNSName)) != set(names):
+            return False
+
+        if self.__authority is None:
+            authority = CertificateAuthority()
+            if not authority.exists():
+                return False
+            self.__authority = authority.load()[0]
+        authority_key = cert.extensions.get_extension_for_class(x509.AuthorityKeyIdentifier).value
+        subject_key = self.__authority.extensions.get_extension_for_class(x509.SubjectKeyIdentifier).value
+        if cert.issuer != self.__authority.subject or authority_key.key_identifier != subject_key.digest:
+            return False
+
+        key = load_private_key(keyPath)
+        if key_type(key) != self.algorithm:
+            return False
+
+        public = serialization.PublicFormat.SubjectPublicKeyInfo
+        return key.public_key().public_bytes(serialization.Encoding.DER, public) == \
+            cert.public_key().public_bytes(serialization.Encoding.DER, public)
+
+
+class CertificatePool:
+    """Parallel Certificate Generator
+
+    Keyword Arguments:
+        workers {int} -- number of worker processes, all cores if None (default: {None})
+        store {TrustStore} -- store trusting the local certificate authority (default: {None})
+        index {CertificateIndex} -- shared fingerprint index, saved by its owner (default: {None})
+        algorithm {str} -- key algorithm (default: {None}, DEFAULT_ALGORITHM)
+        poolSize {int} -- pre-generated keys to keep, 0 to disable the key pool (default: {8})
+    """
+
+    def __init__(self, workers=None, store=None, index=None, algorithm=None, poolSize=8):
+        self.workers = workers or os.cpu_count() or 1
+        self.store = store
+        self.index = index
+        self.algorithm = key_algorithm(algorithm)
+        self.poolSize = int(poolSize)
+        self.__jobs = {}
+
+    def __len__(self):
+        return len(self.__jobs)
+
+    def add(self, domain, certPath, keyPath, names=None):
+        """Queue certificate for generation
+
+        Arguments:
+            domain {str} -- domain name
+            certPath {str} -- path to store certificate file (.crt)
+            keyPath {str} -- path to store certificate key (.key)
+
+        Keyword Arguments:
+            names {list} -- subject alternative names (default: {None})
+        """
+        self.__jobs[domain] = (certPath, keyPath, names)
+
+    def jobs(self):
+        """Return queued certificates
+
+        Returns:
+            dict -- {domain: (certPath, keyPath, names)}
+        """
+        return dict(self.__jobs)
+
+    def run(self):
+        """Generate all queued certificates
+
+        Returns:
+            dict -- {domain: error message, None if successful}
+        """
+        jobs, self.__jobs = self.__jobs, {}
+        results, entries = {}, {}
+        CertificateAuthority(store=self.store).ensure()
+
+        if len(jobs) < 2 or self.workers < 2:
+            for domain, paths in jobs.items():
+                try:
+                    entries[domain] = create_certificate(domain, *paths, algorithm=self.algorithm)
+                    results[domain] = None
+                except Exception as err:
+                    results[domain] = str(err) or err.__class__.__name__
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs))) as pool:
+                futures = {domain: pool.submit(create_certificate, domain, *paths, algorithm=self.algorithm) for domain, paths in jobs.items()}
+                for domain, future in futures.items():
+                    err = future.exception()
+                    results[domain] = (str(err) or err.__class__.__name__) if err else None
+                    if err is None:
+                        entries[domain] = future.result()
+
+        index = self.index if self.index is not None else CertificateIndex()
+        for domain, entry in entries.items():
+            index.record(domain, entry)
+        if self.index is None:
+            index.save()
+
+        KeyPool(self.algorithm, self.poolSize).refill()
+        return results
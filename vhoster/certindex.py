@@ -0,0 +1,175 @@
+import json, os
+from .helpers import *
+from .lock import FileLock, lock_path
+
+
+class CertificateIndex:
+    """Certificate Fingerprint Index
+
+    Records the fingerprints, serial number, expiry, issuer and trust status
+    of certificates created by VHoster, keyed by domain, so that lookups and
+    untrust never have to parse certificate files. Entries are matched to
+    their files by size and modification time.
+
+    Keyword Arguments:
+        path {str} -- path to index file (default: {app_data('certs', 'index.json')})
+    """
+
+    def __init__(self, path=None):
+        self.path = path or app_data('certs', 'index.json')
+        self.__entries = {}
+        self.__paths = {}
+        self.__changes = {}
+        self.load()
+
+    def load(self):
+        """Load index from file, if exists"""
+        self.__entries = read_index(self.path)
+        self.__reindex()
+
+    def __reindex(self):
+        """Rebuild certificate path lookup"""
+        self.__paths = {entry['path']: domain for domain, entry in self.__entries.items()}
+
+    def save(self):
+        """Merge changes into index file
+
+        Only entries changed by this instance are written, so concurrent
+        processes do not overwrite each other's records.
+        """
+        if not self.__changes:
+            return
+
+        with FileLock(lock_path(self.path)):
+            entries = read_index(self.path)
+            for domain, entry in self.__changes.items():
+                if entry is None:
+                    entries.pop(domain, None)
+                else:
+                    entries[domain] = entry
+            atomic_write(self.path, json.dumps(entries, indent=4, sort_keys=True))
+
+        self.__entries = entries
+        self.__changes = {}
+        self.__reindex()
+
+    def all(self):
+        """Return all entries
+
+        Returns:
+            dict -- {domain: entry}
+        """
+        return dict(self.__entries)
+
+    def get(self, domain):
+        """Return entry of domain
+
+        Arguments:
+            domain {str} -- domain name
+
+        Returns:
+            dict -- None if not indexed
+        """
+        return self.__entries.get(domain)
+
+    def current(self, domain, certPath):
+        """Return entry of domain if it still describes the certificate file
+
+        Arguments:
+            domain {str} -- domain name
+            certPath {str} -- path to certificate file (.crt)
+
+        Returns:
+            dict -- None if not indexed or file has changed
+        """
+        entry = self.get(domain)
+        if entry is None or entry['path'] != os.path.abspath(certPath):
+            return None
+        return entry if entry.get('stamp') == file_stamp(certPath) else None
+
+    def find(self, certPath):
+        """Return domain of indexed certificate file
+
+        Arguments:
+            certPath {str} -- path to certificate file (.crt)
+
+        Returns:
+            str -- None if not indexed
+        """
+        return self.__paths.get(os.path.abspath(certPath))
+
+    def record(self, domain, entry):
+        """Add or replace entry of domain
+
+        The trust status of a previous entry is kept if the certificate did
+        not change.
+
+        Arguments:
+            domain {str} -- domain name
+            entry {dict} -- certificate entry
+        """
+        previous = self.get(domain)
+        entry = dict(entry)
+        if previous is not None and previous['sha1'] == entry['sha1']:
+            entry['trusted'] = previous.get('trusted', False)
+        if previous is not None and self.__paths.get(previous['path']) == domain:
+            del self.__paths[previous['path']]
+        self.__entries[domain] = self.__changes[domain] = entry
+        self.__paths[entry['path']] = domain
+
+    def forget(self, domain):
+        """Remove entry of domain
+
+        Arguments:
+            domain {str} -- domain name
+        """
+        if domain in self.__entries:
+            path = self.__entries.pop(domain)['path']
+            if self.__paths.get(path) == domain:
+                del self.__paths[path]
+            self.__changes[domain] = None
+
+    def setTrusted(self, domain, trusted=True):
+        """Set trust status of domain
+
+        Arguments:
+            domain {str} -- domain name
+
+        Keyword Arguments:
+            trusted {bool} -- added to trusted root certificates (default: {True})
+        """
+        entry = self.get(domain)
+        if entry is not None and entry.get('trusted') != trusted:
+            self.__entries[domain] = self.__changes[domain] = dict(entry, trusted=trusted)
+
+
+def read_index(path):
+    """Read index file
+
+    Arguments:
+        path {str} -- path to index file
+
+    Returns:
+        dict
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def file_stamp(path):
+    """Return size and modification time of file
+
+    Arguments:
+        path {str}
+
+    Returns:
+        list -- None if file does not exist
+    """
+    try:
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return None
@@ -2,4 +2,6 @@
 from .core import *
 from .site import *
 from .config import *
-from .services import *
\ No newline at end of file
+from .services import *
+from .certs import *
+from .daemon import *
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""Certificate CLI Commands"""
+from .core import *
+
+# Export the group only, `status` must not replace other package-level names
+__all__ = ['certs']
+
+
+@main.group()
+def certs():
+    """Manage site certificates"""
+    pass
+
+
+@certs.command(short_help='Reissue self-signed site certificates')
+@click.option('--workers', '-w', metavar='N', type=click.IntRange(min=1), default=None, help='Certificate worker processes (default: all cores)')
+@pass_state
+def migrate(state, workers):
+    """Replace self-signed site certificates with ones issued by the local certificate authority"""
+    sites = [s for s in state.site.list() if s.secure and s.certificate.isSelfSigned(s.certPath())]
+    if not sites:
+        info('All site certificates are issued by the local certificate authority')
+        return
+
+    with Transaction(state.config, workers=workers):
+        for s in sites:
+            warn(s.domain, title='Migrating')
+            s.removeCertificate()
+            s.createCertificate()
+    state.server.reload()
+    success('\n%d site certificates migrated' % len(sites))
+
+
+@certs.command(short_help='List site certificates')
+@click.option('--full', '-f', is_flag=True, help='Show serial numbers and full fingerprints')
+@pass_state
+def status(state, full):
+    """List certificates of all secure sites with fingerprints, expiry and trust status
+
+    Certificates are read from the fingerprint index; only files that are
+    not indexed yet (or changed since) are parsed.
+    """
+    from datetime import datetime
+    from terminaltables import AsciiTable
+    from ..certindex import CertificateIndex
+
+    index = CertificateIndex()
+    authority = index.get(index.find(app_data('certs', 'ca.crt')) or '') or {}
+    rows = [('Local CA', app_data('certs', 'ca.crt'), authority or None)] if authority else []
+    for s in state.site.list():
+        if s.secure:
+            certPath = s.certPath()
+            entry = index.current(s.domain, certPath) or index.current(index.find(certPath), certPath)
+            if entry is None and os.path.isfile(certPath):
+                from ..certificate import Certificate
+                entry = Certificate(s.domain, index=index).inspect(certPath)
+            rows.append((s.domain, certPath, entry))
+    if Plan.recording() is None:
+        index.save()
+
+    if not rows:
+        warn('No site certificates found')
+        return
+
+    header = ['Domain', 'Issuer', 'Expires', 'Trusted', 'SHA-1']
+    table = AsciiTable([header + (['Serial', 'SHA-256'] if full else [])])
+    now = datetime.utcnow()
+    for domain, certPath, entry in rows:
+        if entry is None:
+            table.table_data.append([domain, click.style('Missing', fg='red'), '', '', ''] + (['', ''] if full else []))
+            continue
+
+        days = (datetime.fromisoformat(entry['expires']) - now).days
+        if entry.get('trusted'):
+            trusted = click.style('Yes', fg='green')
+        elif authority.get('trusted') and entry['issuer'] == authority.get('issuer'):
+            trusted = click.style('Via CA', fg='green')
+        else:
+            trusted = click.style('No', fg='red')
+
+        table.table_data.append([
+            click.style(domain, fg='bright_yellow'),
+            entry['issuer'],
+            click.style('%s (%d days)' % (entry['expires'][:10], days), fg='red' if days < 30 else None),
+            trusted,
+            entry['sha1'] if full else entry['sha1'][:23] + '...'
+        ] + ([entry['serial'], entry['sha256']] if full else []))
+    echo(table.table)
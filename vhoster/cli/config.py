@@ -16,6 +16,7 @@ def get(state, key):
     if key not in ['sites']:
         data = state.config.get(key)
         if type(data) in [dict, list]:
+            from terminaltables import AsciiTable
             table = []
             if isinstance(data, dict):
                 table.append(['Config', 'Value'])
@@ -1,7 +1,14 @@
 """Core CLI Commands"""
-from .. import *
+from ..helpers import *
+from ..errors import *
+from ..config import Config
+from ..site import Site, SiteStore
+from ..server import Server
+from ..transaction import Transaction
+from ..bundle import Bundle
+from ..manifest import Manifest, hosts_lines
+from ..plan import Plan
 from click_alias import ClickAliasedGroup
-from terminaltables import AsciiTable
 import click, platform, os
 
 def app(key=''):
@@ -17,20 +24,42 @@ def app(key=''):
 class State(object):
     """State Context"""
 
-    def __init__(self, config: Config, path=None):
+    def __init__(self, config: Config, path=None, store=None):
         self.path = os.path.abspath(path)
         self.config = config
-        self.site = Site(self.config, path=self.path)
+        self.site = Site(self.config, path=self.path, store=store)
         self.server = Server(self.config)
-        self.ngrok = Ngrok(self.config)
+        self.__ngrok = None
+
+    @property
+    def ngrok(self):
+        """Return ngrok driver, importing pyngrok on first use
+
+        Returns:
+            Ngrok
+        """
+        if self.__ngrok is None:
+            from ..ngrok import Ngrok
+            self.__ngrok = Ngrok(self.config)
+        return self.__ngrok
 
 pass_state = click.make_pass_decorator(State)
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
+# Commands that only read the configuration hold a shared lock, long-running
+# or service commands hold none, every other command holds an exclusive lock
+READ_ONLY_COMMANDS = ['list', 'show', 'open', 'explore', 'export']
+UNLOCKED_COMMANDS = ['share', 'start', 'stop', 'daemon', 'watch']
+
+# Commands whose changes are planned by transactions, and can be previewed with --dry-run
+PLANNED_COMMANDS = ['park', 'create', 'forget', 'remove', 'secure', 'unsecure', 'link', 'rename',
+                    'set-root', 'refresh', 'rebuild', 'import', 'mirror', 'certs']
+
 @click.group(cls=ClickAliasedGroup, context_settings=CONTEXT_SETTINGS)
 @click.version_option(app('version'), '--version', '-v', message='%(version)s')
+@click.option('--dry-run', '-n', is_flag=True, help='Show planned file changes as a diff without applying them')
 @click.pass_context
-def main(ctx):
+def main(ctx, dry_run):
     """Apache Virtual Host Manager
 
     \b
@@ -41,14 +70,45 @@ def main(ctx):
         error(platform.system(), title='Platform not supported')
         raise click.Abort()
 
-    try:
-        config = Config(app_data('config.json'))
-    except InvalidConfigError as err:
-        raise click.ClickException(err)
-        echo('Please run `config setup` to create fresh configuration')
-        raise click.Abort()
+    # The daemon passes a dict to keep configuration and site store between invocations
+    cache = ctx.obj if isinstance(ctx.obj, dict) else {}
+    cached = cache.get('config') is not None
+    if not cached:
+        try:
+            cache['config'] = Config(app_data('config.json'))
+        except InvalidConfigError as err:
+            raise click.ClickException(err)
+            echo('Please run `config setup` to create fresh configuration')
+            raise click.Abort()
+    config = cache['config']
+
+    if dry_run and ctx.invoked_subcommand not in PLANNED_COMMANDS + READ_ONLY_COMMANDS:
+        raise click.ClickException("'%s' does not support --dry-run" % ctx.invoked_subcommand)
+
+    if ctx.invoked_subcommand not in UNLOCKED_COMMANDS:
+        lock = config.acquire(shared=ctx.invoked_subcommand in READ_ONLY_COMMANDS)
+        ctx.call_on_close(lock.release)
+    elif cached:
+        config.acquire(shared=True).release()
+
+    if dry_run:
+        recording = Plan.record()
+        plan = recording.__enter__()
+
+        def show():
+            recording.__exit__(None, None, None)
+            # Discard planned changes kept in memory (by the daemon)
+            if config.path in plan.files or config.isDirty():
+                config.load()
+            echo('')
+            warn('Dry run, no changes were made')
+            plan.show()
+        ctx.call_on_close(show)
+
+    if cache.get('store') is None or not cache['store'].isCurrent():
+        cache['store'] = SiteStore(config)
 
-    ctx.obj = State(config, path=os.getcwd())
+    ctx.obj = State(config, path=os.getcwd(), store=cache['store'])
     if len(ctx.obj.site.links()) > 1:
         info('Multiple sites are found to be registered to this path.\nThe program will use `%s` by default.' % ctx.obj.site.domain)
         echo('\nTo use other domains, simple pass the domain parameter:\n\n\tvhoster show otherdomain.test\n')
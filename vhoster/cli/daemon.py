@@ -0,0 +1,82 @@
+"""Daemon CLI Commands"""
+from .core import *
+from ..daemon import Daemon, call, format_address, read_info, status as daemon_status
+import sys, time
+
+# Export the group only, so `start` and `stop` keep referring to the services commands
+__all__ = ['daemon']
+
+
+@main.group()
+def daemon():
+    """Manage command daemon"""
+    pass
+
+
+@daemon.command(short_help='Start command daemon')
+@click.option('--background', '-b', is_flag=True, help='Detach from the terminal')
+def start(background):
+    """Keep configuration, sites and certificates in memory and run commands sent by the CLI
+
+    While the daemon is running, commands are sent to it transparently.
+    Apache reloads are deferred until no command was received for half
+    a second.
+    """
+    running = daemon_status()
+    if running:
+        info('Daemon is already running (PID %d)' % running['pid'])
+        return
+
+    if not background:
+        Daemon().serve()
+        return
+
+    import subprocess
+    command = [sys.executable, 'daemon', 'start'] if getattr(sys, 'frozen', False) else [sys.executable, '-m', 'vhoster.daemon']
+    options = {'creationflags': 0x00000008 | 0x00000200} if is_os('Windows') else {'start_new_session': True}
+    with open(app_data('daemon.log'), 'a') as log:
+        subprocess.Popen(
+            command, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), **options
+        )
+
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        running = daemon_status()
+        if running:
+            success('Daemon started (PID %d)' % running['pid'])
+            return
+        time.sleep(0.1)
+    raise click.ClickException('Daemon did not start, see %s' % app_data('daemon.log'))
+
+
+@daemon.command(short_help='Stop command daemon')
+def stop():
+    """Stop command daemon, running pending Apache reloads first"""
+    try:
+        call('shutdown', timeout=10)
+    except ConnectionError:
+        info('Daemon is not running')
+        return
+
+    deadline = time.time() + 30
+    while read_info() and time.time() < deadline:
+        time.sleep(0.1)
+    warn('Daemon stopped')
+
+
+@daemon.command(short_help='Show command daemon status')
+def status():
+    """Show command daemon status"""
+    running = daemon_status()
+    if not running:
+        info('Daemon is not running')
+        return
+
+    echo(running['pid'], title='PID', style='green')
+    echo(format_address(running), title='Address', style='green')
+    echo(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(running['started'])), title='Started', style='green')
+    if running['sites'] is not None:
+        echo(running['sites'], title='Sites', style='green')
+    if running['pending']:
+        echo('Apache reload pending', style='yellow')
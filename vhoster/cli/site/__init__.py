@@ -1,2 +1,3 @@
 from .site import *
-from .mirror import *
\ No newline at end of file
+from .mirror import *
+from .provision import *
\ No newline at end of file
@@ -19,9 +19,10 @@ def add(state, mirror, domain, path):
         site = site.find(domain=domain, path=path)
 
     if site.exists():
-        site.addMirror(mirror)
-        site.save()
-        state.server.restart()
+        with Transaction(state.config):
+            site.addMirror(mirror)
+            site.save()
+        state.server.reload()
         success('\nSite %s mirrored to %s' % (site.domain, mirror))
     else:
         raise click.ClickException(SiteNotFoundError(domain or site.domain, path or site.path))
@@ -40,9 +41,10 @@ def remove(state, mirror, domain, path):
         site = site.find(domain=domain, path=path)
 
     if site.exists():
-        site.removeMirror(mirror)
-        site.save()
-        state.server.restart()
+        with Transaction(state.config):
+            site.removeMirror(mirror)
+            site.save()
+        state.server.reload()
         success('\Mirror %s removed from %s' % (mirror, site.domain))
     else:
         raise click.ClickException(SiteNotFoundError(domain or site.domain, path or site.path))
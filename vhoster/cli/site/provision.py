@@ -0,0 +1,79 @@
+"""Site Import and Export Commands"""
+from ..core import *
+import time
+
+
+@main.command('import', short_help='Register sites from a manifest')
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--format', '-f', 'format', type=click.Choice(['json', 'csv']), default=None, help='Manifest format (default: from extension)')
+@click.option('--update', '-u', is_flag=True, help='Replace registered sites with the same domain')
+@click.option('--skip-invalid', is_flag=True, help='Import valid sites even if others are invalid')
+@click.option('--workers', '-w', metavar='N', type=click.IntRange(min=1), default=None, help='Certificate worker processes (default: all cores)')
+@pass_state
+def import_(state, manifest, format, update, skip_invalid, workers):
+    """Register all sites defined in MANIFEST (JSON or CSV, '-' for stdin)
+
+    \b
+    JSON: {"sites": [{"domain": "app.test", "path": "app", "root": "public", "secure": true, "mirrors": ["api.test"]}]}
+    CSV:  domain,path,root,secure,mirrors
+
+    Sites are validated before anything is written. Configuration, hosts and
+    Apache files are then written once for all sites, followed by a single
+    reload.
+    """
+    import csv
+    from ...provision import plan_import, read_manifest
+
+    started = time.perf_counter()
+    try:
+        entries = read_manifest(manifest, format)
+    except (OSError, ValueError, csv.Error) as err:
+        raise click.ClickException('Cannot read manifest: %s' % err)
+
+    store = state.site.store
+    accepted, errors = plan_import(entries, store, update)
+    for number, message in errors:
+        error(message, title='Entry %d' % number)
+    if errors and not skip_invalid:
+        raise click.ClickException('%d of %d sites are invalid, nothing was imported' % (len({n for n, _ in errors}), len(entries)))
+    if not accepted:
+        info('No sites to import')
+        return
+
+    with Transaction(state.config, workers=workers) as transaction:
+        for id, record in accepted:
+            if id is None:
+                site = Site(state.config, record.domain, record.path, record.root, record.secure, store=store)
+            else:
+                site = Site(state.config, id=id, store=store)
+                site.path, site.root, site.secure = record.path, record.root, record.secure
+                for mirror in site.mirrors:
+                    if mirror not in record.mirrors:
+                        site.removeMirror(mirror)
+            for mirror in record.mirrors:
+                if mirror not in site.mirrors:
+                    site.addMirror(mirror)
+            site.save()
+    elapsed = time.perf_counter() - started
+    if any(record.secure for _, record in accepted):
+        info('%d reused, %d generated' % (transaction.cache.hits, transaction.cache.misses), title='Certificates')
+
+    state.server.reload()
+    success('\n%d sites imported in %.2fs (%.0f sites/sec)' % (len(accepted), elapsed, len(accepted) / max(elapsed, 1e-6)))
+
+
+@main.command(short_help='Write registered sites to a manifest')
+@click.argument('output', type=click.Path(dir_okay=False, writable=True, allow_dash=True), default='-')
+@click.option('--format', '-f', 'format', type=click.Choice(['json', 'csv']), default=None, help='Manifest format (default: from extension)')
+@pass_state
+def export(state, output, format):
+    """Write all registered sites to OUTPUT (JSON or CSV, default: stdout)
+
+    The manifest can be registered again with `import`.
+    """
+    from ...provision import write_manifest
+
+    records = state.site.store.all()
+    write_manifest(records, output, format)
+    if output != '-':
+        success('%d sites exported to %s' % (len(records), output))
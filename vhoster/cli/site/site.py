@@ -6,6 +6,7 @@ from ..core import *
 @pass_state
 def list(state):
     """List all registered sites"""
+    from terminaltables import AsciiTable
     table = AsciiTable([['Path', 'URL', 'Secure']])
     sites = state.site.list()
     if sites:
@@ -34,6 +35,7 @@ def show(state, domain):
         raise click.ClickException(SiteNotFoundError(domain or site.domain, site.path))
         raise click.Abort()
     
+    from terminaltables import AsciiTable
     table = AsciiTable([
         ['Path:', click.style(site.path, fg='bright_yellow')],
         ['Document Root:', site.documentRoot()] if site.root else ['', ''],
@@ -91,7 +93,7 @@ def park(state, domain, path, root, secure):
     """Register the current (or specified) PATH to given DOMAIN"""
     site = state.site
     try:
-        site = Site(state.config, domain=domain)
+        site = Site(state.config, domain=domain, store=state.site.store)
         site.path = path if path else state.path
         
         if root:
@@ -99,8 +101,9 @@ def park(state, domain, path, root, secure):
         if secure:
             site.secure = secure
 
-        site.save()
-        state.server.restart()
+        with Transaction(state.config):
+            site.save()
+        state.server.reload()
         success('\nSite registered successfully!')
     except SiteError as err:
         raise click.ClickException(err)
@@ -121,16 +124,33 @@ def forget(state, domain, path):
         raise click.Abort()
 
     site.delete()
-    state.server.restart()
+    state.server.reload()
     success('\nSite removed successfully!')
     
 
 @main.command(short_help='Secure the site with a trusted TLS certificate')
 @click.argument('domain', type=str, required=False, default=None)
 @click.option('--path', '-p', metavar='PATH', type=click.Path(exists=True, file_okay=False), default=None, help='Specify custom path')
+@click.option('--all', '-a', 'all_', is_flag=True, help='Secure all registered sites')
+@click.option('--workers', '-w', metavar='N', type=click.IntRange(min=1), default=None, help='Certificate worker processes (default: all cores)')
 @pass_state
-def secure(state, domain, path):
+def secure(state, domain, path, all_, workers):
     """Secure the current (or specified) PATH or DOMAIN with a trusted TLS certificate"""
+    if all_:
+        sites = [s for s in state.site.list() if not s.secure]
+        if not sites:
+            warn('No unsecured sites found')
+            return
+
+        with Transaction(state.config, workers=workers) as transaction:
+            for s in sites:
+                warn(s.domain, title='Securing')
+                s.secure = True
+                s.save()
+        state.server.reload()
+        success('\n%d of %d sites are now available over HTTPS!' % (len(sites) - len(transaction.failures), len(sites)))
+        return
+
     site = state.site
     if domain or path:
         site = site.find(domain=domain, path=path)
@@ -138,7 +158,7 @@ def secure(state, domain, path):
     if site.exists():
         site.secure = True
         site.save()
-        state.server.restart()
+        state.server.reload()
         success('\nSite is now available over HTTPS!')
     else:
         raise click.ClickException(SiteNotFoundError(domain or site.domain, path or site.path))
@@ -158,7 +178,7 @@ def unsecure(state, domain, path):
     if site.exists():
         site.secure = False
         site.save()
-        state.server.restart()
+        state.server.reload()
         success('\nSite TLS certificate removed!')
     else:
         raise click.ClickException(SiteNotFoundError(domain or site.domain, path or site.path))
@@ -178,7 +198,7 @@ def link(state, domain, path):
     if site.exists():
         site.domain = domain
         site.save()
-        state.server.restart()
+        state.server.reload()
         success('\nCurrent directory successfully linked to %s' % site.url())
     else:
         raise click.ClickException(SiteNotFoundError(domain or site.domain, path or site.path))
@@ -197,7 +217,7 @@ def rename(state, old, new):
     if site.exists():
         site.domain = new
         site.save()
-        state.server.restart()
+        state.server.reload()
         success('\nSite successfully parked to %s' % site.url())
     else:
         raise click.ClickException(SiteNotFoundError(old))
@@ -217,7 +237,7 @@ def set_root(state, path, domain):
     if site.exists():
         site.root = path
         site.save()
-        state.server.restart()
+        state.server.reload()
         success('\nSite %s document root set to  %s' % (site.url(), site.documentRoot()))
     else:
         raise click.ClickException(SiteNotFoundError(domain or site.domain, path or site.path))
@@ -236,23 +256,71 @@ def refresh(state, domain, path):
 
     if site.exists():
         site.save(force=True)
-        state.server.restart()
+        state.server.reload()
     else:
         raise click.ClickException(SiteNotFoundError(domain or site.domain, path or site.path))
         raise click.Abort()
 
 
 @main.command()
+@click.option('--full', '-f', is_flag=True, help='Rebuild all sites, including unchanged ones')
+@click.option('--workers', '-w', metavar='N', type=click.IntRange(min=1), default=None, help='Certificate worker processes (default: all cores)')
 @pass_state
-def rebuild(state):
+def rebuild(state, full, workers):
     """Rebuild all site configuration files"""
     sites = state.site.list()
     if sites:
-        for s in sites: 
-            warn(s.domain, title='Rebuilding')
-            s.save(force=True)
-            echo('')
-        state.server.restart()
+        manifest = Manifest()
+        hostsPath = state.config.get('dns.file')
+        if not full:
+            hosts = hosts_lines(hostsPath)
+            sites = [s for s in sites if manifest.changed(s, hosts)]
+            if not sites:
+                info('All sites are up to date')
+                return
+
+        with Transaction(state.config, workers=workers) as transaction:
+            for s in sites: 
+                warn(s.domain, title='Rebuilding')
+                s.save(force=True)
+                echo('')
+        info('%d reused, %d generated' % (transaction.cache.hits, transaction.cache.misses), title='Certificates')
+
+        if len(sites) == len(state.site.store.all()):
+            for name in Bundle(state.config).prune():
+                info(name, title='Deleted')
+
+        hosts = hosts_lines(hostsPath)
+        for s in sites:
+            manifest.record(s, hosts)
+        manifest.prune(s.domain for s in state.site.list())
+        manifest.save()
+        state.server.reload()
+
+
+@main.command(short_help='Refresh sites when their directories change')
+@click.option('--polling', is_flag=True, help='Poll directories instead of using inotify')
+@click.option('--interval', '-i', metavar='SECONDS', type=click.FloatRange(min=0.1), default=1.0, help='Polling interval (default: 1)')
+@click.option('--debounce', '-d', metavar='SECONDS', type=click.FloatRange(min=0), default=0.5, help='Wait for changes to settle (default: 0.5)')
+@pass_state
+def watch(state, polling, interval, debounce):
+    """Watch site paths and document roots, refreshing affected sites
+
+    Sites whose document root appeared or disappeared are refreshed, sites
+    whose directory was renamed are moved to the new path. Changes are
+    applied together, followed by a single Apache reload.
+    """
+    from ...watcher import SiteWatcher, create_watcher
+
+    watcher = SiteWatcher(state.config, create_watcher(polling, interval), debounce)
+    info('Watching %d directories of %d sites (%s)' % (
+        len(watcher.watcher), len(watcher.store.all()), watcher.watcher.__class__.__name__.replace('Watcher', '').lower()))
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
 
 
 @main.command(short_help='Generable public url for the site')
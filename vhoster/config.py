@@ -1,13 +1,23 @@
 import os
 import json
+from contextlib import contextmanager
 from copy import deepcopy
 from .helpers import *
 from .errors import InvalidConfigError
+from .lock import FileLock, lock_path
+from .plan import Plan
 
 
 class Config:
     """Configuration Driver
 
+    Changes are tracked so unchanged data is never rewritten, and saves
+    inside a `batch()` block are coalesced into a single atomic write.
+    Parsed data is cached in a binary sidecar file (validated by mtime,
+    size and content hash) so unchanged files load without parsing JSON.
+    Reads and writes are guarded by advisory file locks shared with other
+    processes.
+
     Keyword Arguments:
         path {str} -- path to data store file (default: {''})
     """
@@ -15,6 +25,10 @@ class Config:
     def __init__(self, path=''):
         self.__path = path
         self.__data = {}
+        self.__dirty = False
+        self.__depth = 0
+        self.__content = None
+        self.__loaded = None
         self.load()
 
     def __repr__(self):
@@ -69,12 +83,15 @@ class Config:
         for i, node in enumerate(nodes):
             if isinstance(data, dict):
                 if i + 1 == len(nodes) and (node in data.keys() or create):
-                    data[node] = value
+                    if node not in data.keys() or data[node] != value:
+                        data[node] = value
+                        self.__dirty = True
                     break
                 else:
                     if node not in data.keys():
                         if create:
                             data[node] = {}
+                            self.__dirty = True
                         else:
                             break                    
                     data = data[node]
@@ -94,6 +111,7 @@ class Config:
             if isinstance(data, dict):
                 if i + 1 == len(nodes) and node in data.keys():
                     del data[node]
+                    self.__dirty = True
                     break
                 else:
                     if node in data.keys():
@@ -102,21 +120,202 @@ class Config:
 
         self.save()
 
+    def lock(self, shared=False):
+        """Return advisory lock guarding the data store file
+
+        Keyword Arguments:
+            shared {bool} -- shared (reader) lock (default: {False})
+
+        Returns:
+            FileLock
+        """
+        return FileLock(lock_path(self.path), shared=shared)
+
+    def acquire(self, shared=False):
+        """Acquire data store lock and reload data if the file was changed by another process
+
+        Keyword Arguments:
+            shared {bool} -- shared (reader) lock (default: {False})
+
+        Returns:
+            FileLock -- acquired lock, to be released by caller
+        """
+        lock = self.lock(shared)
+        lock.acquire()
+        if self.path and not self.__dirty and self.__stat() != self.__loaded:
+            self.load()
+        return lock
+
+    @contextmanager
+    def locked(self, shared=False):
+        """Hold data store lock, reloading stale data on entry
+
+        Keyword Arguments:
+            shared {bool} -- shared (reader) lock (default: {False})
+        """
+        lock = self.acquire(shared)
+        try:
+            yield self
+        finally:
+            lock.release()
+
+    def __stat(self):
+        """Return modification time and size of data store file
+
+        Returns:
+            tuple -- None if file does not exist
+        """
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
     def load(self):
         """Load data from file, if path is defined"""
         try:
             if self.path:
-                if os.path.exists(self.path) and os.path.isfile(self.path):
-                    with open(self.path, 'r') as f:
-                        self.__data = json.load(f)
-                else:
-                    with open(self.path, 'w+'):
-                        pass
+                with self.lock(shared=True):
+                    if os.path.exists(self.path) and os.path.isfile(self.path):
+                        with open(self.path, 'rb') as f:
+                            raw = f.read()
+                        self.__content = raw.decode('utf-8')
+                        self.__data = self.__loadCache(raw)
+                        if self.__data is None:
+                            self.__data = json.loads(self.__content)
+                            self.__saveCache(raw)
+                    else:
+                        with open(self.path, 'w+'):
+                            pass
+                    self.__loaded = self.__stat()
         except Exception as err:
             raise InvalidConfigError(str(err))
 
+        self.__dirty = False
+
+    def touch(self):
+        """Mark data as modified (after changing values in place)"""
+        self.__dirty = True
+
+    def isDirty(self):
+        """Check if data has unsaved changes
+
+        Returns:
+            bool
+        """
+        return self.__dirty
+
+    @contextmanager
+    def batch(self):
+        """Defer saves until the outermost batch block exits"""
+        self.__depth += 1
+        try:
+            yield self
+        finally:
+            self.__depth -= 1
+            if self.__depth == 0:
+                self.save()
+
     def save(self):
-        """Save data to file, if file is defined"""
+        """Save data to file, if file is defined and data was modified
+
+        In dry-run mode, the change is added to the recording plan instead.
+        """
+        if self.__depth or not self.__dirty:
+            return
+
         if self.path:
-            with open(self.path, 'w+') as f:
-                json.dump(self.__data, f, indent=4)
+            content = json.dumps(self.__data, indent=4, default=serialize)
+            plan = Plan.recording()
+            if plan is not None:
+                plan.write(self.path, content)
+            elif content != self.__content:
+                with self.lock():
+                    atomic_write(self.path, content)
+                    self.__content = content
+                    self.__loaded = self.__stat()
+                    self.__saveCache(content.encode('utf-8'))
+        self.__dirty = False
+
+    @property
+    def cachePath(self):
+        """Return path to binary cache sidecar file
+
+        Returns:
+            str
+        """
+        return self.path + '.cache'
+
+    def __loadCache(self, raw):
+        """Load data from cache sidecar, if it matches the file
+
+        Arguments:
+            raw {bytes} -- data store file contents
+
+        Returns:
+            mixed -- None if cache is missing or stale
+        """
+        import gc, hashlib, marshal, sys
+        try:
+            stat = os.stat(self.path)
+            with open(self.cachePath, 'rb') as f:
+                cache = f.read()
+            # Object graph is acyclic, skip garbage collection while unmarshalling
+            enabled = gc.isenabled()
+            gc.disable()
+            try:
+                header, data = marshal.loads(cache)
+            finally:
+                if enabled:
+                    gc.enable()
+            if header == (tuple(sys.version_info[:2]), stat.st_mtime_ns, stat.st_size, hashlib.sha1(raw).hexdigest()):
+                return data
+        except Exception:
+            pass
+        return None
+
+    def __saveCache(self, raw):
+        """Write data to cache sidecar
+
+        Arguments:
+            raw {bytes} -- data store file contents
+        """
+        import hashlib, marshal, sys
+        try:
+            stat = os.stat(self.path)
+            header = (tuple(sys.version_info[:2]), stat.st_mtime_ns, stat.st_size, hashlib.sha1(raw).hexdigest())
+            atomic_write(self.cachePath, marshal.dumps((header, plain(self.__data))))
+        except Exception:
+            pass
+
+
+def serialize(value):
+    """Serialize objects providing `toDict()` (e.g. site records) to JSON
+
+    Arguments:
+        value {mixed}
+
+    Returns:
+        dict
+    """
+    if hasattr(value, 'toDict'):
+        return value.toDict()
+    raise TypeError('Object of type %s is not JSON serializable' % value.__class__.__name__)
+
+
+def plain(value):
+    """Convert value to plain dicts and lists (e.g. site records to dictionaries)
+
+    Arguments:
+        value {mixed}
+
+    Returns:
+        mixed
+    """
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    if hasattr(value, 'toDict'):
+        return value.toDict()
+    return value
@@ -0,0 +1,420 @@
+"""Daemon Mode
+
+The daemon keeps configuration, site store, compiled templates and the
+certificate authority in memory and runs CLI commands sent by clients over
+a local socket (a Unix domain socket, or loopback TCP where unavailable).
+
+Requests and responses are single-line JSON-RPC 2.0 messages, one request
+per connection:
+
+    {"jsonrpc": "2.0", "id": 1, "method": "run", "params": {"token": "...", "args": ["park"], "cwd": "/www/app", "color": true}}
+    {"jsonrpc": "2.0", "id": 1, "result": {"code": 0, "output": "...", "errors": "", "elapsed": 0.01}}
+
+Methods: `run`, `ping` and `shutdown`. The address and access token are
+published in `daemon.json`, readable only by the current user.
+"""
+import hmac, json, os, socket, sys, time
+from .helpers import *
+
+# Commands that prompt, launch programs in the user session or manage the daemon itself
+LOCAL_COMMANDS = ['daemon', 'config', 'share', 'open', 'explore', 'watch']
+
+MAX_REQUEST = 1 << 20
+
+
+class Daemon:
+    """VHoster Daemon
+
+    Requests are handled one at a time, each one inside the same process,
+    so commands never run concurrently. Apache reloads requested by
+    commands are deferred until no request arrived for the debounce window.
+
+    Keyword Arguments:
+        debounce {float} -- idle seconds before scheduled reloads are run (default: {0.5})
+    """
+
+    def __init__(self, debounce=0.5):
+        self.debounce = debounce
+        self.token = os.urandom(16).hex()
+        self.context = {}
+        self.__socket = None
+        self.__address = None
+        self.__pending = None
+        self.__running = False
+        self.__busy = False
+
+    @property
+    def address(self):
+        """Return listening address
+
+        Returns:
+            dict -- {family, path} or {family, host, port}
+        """
+        return self.__address
+
+    def listen(self):
+        """Bind control socket and publish daemon information"""
+        if hasattr(socket, 'AF_UNIX'):
+            path = app_data('daemon.sock')
+            if os.path.exists(path):
+                os.remove(path)
+            self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            umask = os.umask(0o077)
+            try:
+                self.__socket.bind(path)
+            finally:
+                os.umask(umask)
+            self.__address = {'family': 'unix', 'path': path}
+        else:
+            self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.__socket.bind(('127.0.0.1', 0))
+            self.__address = {'family': 'tcp', 'host': '127.0.0.1', 'port': self.__socket.getsockname()[1]}
+        self.__socket.listen(16)
+
+        atomic_write(info_path(), json.dumps(dict(
+            self.__address, pid=os.getpid(), token=self.token, source=source_stamp(), started=time.time()
+        ), indent=4))
+
+    def close(self):
+        """Close control socket and remove daemon information"""
+        if self.__socket is not None:
+            self.__socket.close()
+            self.__socket = None
+        if self.__address is not None and self.__address['family'] == 'unix' and os.path.exists(self.__address['path']):
+            os.remove(self.__address['path'])
+        if read_info().get('pid') == os.getpid():
+            os.remove(info_path())
+
+    def serve(self):
+        """Listen and handle requests until stopped"""
+        import signal
+        from .server import Server
+
+        def terminate(signum, frame):
+            self.__running = False
+            if not self.__busy:
+                raise KeyboardInterrupt
+
+        self.listen()
+        Server.deferred = self.defer
+        self.__running = True
+        try:
+            signal.signal(signal.SIGTERM, terminate)
+        except ValueError:
+            pass
+
+        success('VHoster daemon listening on %s' % format_address(self.__address))
+        try:
+            while self.__running:
+                self.__socket.settimeout(self.debounce if self.__pending is not None else None)
+                try:
+                    conn, _ = self.__socket.accept()
+                except socket.timeout:
+                    self.reload()
+                    continue
+                with conn:
+                    self.__busy = True
+                    try:
+                        self.handle(conn)
+                    finally:
+                        self.__busy = False
+        except KeyboardInterrupt:
+            pass
+        finally:
+            Server.deferred = None
+            self.close()
+            self.reload()
+            warn('VHoster daemon stopped')
+
+    def defer(self, server):
+        """Schedule Apache reload
+
+        Arguments:
+            server {Server} -- server requesting the reload
+        """
+        self.__pending = server
+
+    def reload(self):
+        """Run scheduled Apache reload, if any"""
+        from .server import Server
+
+        server, self.__pending = self.__pending, None
+        if server is None:
+            return
+        deferred, Server.deferred = Server.deferred, None
+        try:
+            server.reload(debounce=0)
+        finally:
+            Server.deferred = deferred
+
+    def handle(self, conn):
+        """Read request from connection and send response
+
+        Arguments:
+            conn {socket} -- client connection
+        """
+        conn.settimeout(10)
+        try:
+            with conn.makefile('rb') as f:
+                line = f.readline(MAX_REQUEST)
+            response = self.dispatch(json.loads(line.decode('utf-8')))
+        except (OSError, ValueError):
+            response = rpc_error(None, -32700, 'Parse error')
+
+        try:
+            conn.sendall(json.dumps(response).encode('utf-8') + b'\n')
+        except OSError:
+            pass
+
+    def dispatch(self, request):
+        """Run JSON-RPC request
+
+        Arguments:
+            request {dict}
+
+        Returns:
+            dict -- JSON-RPC response
+        """
+        if not isinstance(request, dict) or not isinstance(request.get('method'), str) or not isinstance(request.get('params', {}), dict):
+            return rpc_error(None, -32600, 'Invalid request')
+
+        id, params = request.get('id'), request.get('params', {})
+        if not hmac.compare_digest(str(params.get('token', '')), self.token):
+            return rpc_error(id, -32001, 'Invalid token')
+
+        method = {'run': self.run, 'ping': self.ping, 'shutdown': self.shutdown}.get(request['method'])
+        if method is None:
+            return rpc_error(id, -32601, 'Method not found: %s' % request['method'])
+
+        try:
+            return {'jsonrpc': '2.0', 'id': id, 'result': method(params)}
+        except Exception as err:
+            return rpc_error(id, -32603, str(err) or err.__class__.__name__)
+
+    def run(self, params):
+        """Run CLI command with captured output
+
+        Arguments:
+            params {dict} -- {args, cwd, color}
+
+        Returns:
+            dict -- {code, output, errors, elapsed}
+        """
+        import io
+        from .cli import main
+
+        args = [str(arg) for arg in params.get('args', [])]
+        if args and args[0] in LOCAL_COMMANDS:
+            raise ValueError('Command must be run locally: %s' % args[0])
+
+        cwd, streams = os.getcwd(), (sys.stdin, sys.stdout, sys.stderr)
+        sys.stdin, sys.stdout, sys.stderr = io.StringIO(), io.StringIO(), io.StringIO()
+        started = time.perf_counter()
+        try:
+            os.chdir(params.get('cwd') or cwd)
+            code = invoke(main, args, self.context, bool(params.get('color')))
+        finally:
+            output, errors = sys.stdout.getvalue(), sys.stderr.getvalue()
+            sys.stdin, sys.stdout, sys.stderr = streams
+            os.chdir(cwd)
+
+        elapsed = time.perf_counter() - started
+        echo('%s (exit %d, %.0fms)' % (' '.join(args) or '--help', code, elapsed * 1e3), style=None if code == 0 else 'red')
+        return {'code': code, 'output': output, 'errors': errors, 'elapsed': elapsed}
+
+    def ping(self, params):
+        """Return daemon status
+
+        Returns:
+            dict -- {pid, sites, pending}
+        """
+        store = self.context.get('store')
+        return {'pid': os.getpid(), 'sites': len(store.all()) if store is not None else None, 'pending': self.__pending is not None}
+
+    def shutdown(self, params):
+        """Stop daemon after the response is sent
+
+        Returns:
+            bool
+        """
+        self.__running = False
+        return True
+
+
+def invoke(command, args, obj, color=None):
+    """Run click command as if called from the command line
+
+    Arguments:
+        command {click.Command}
+        args {list} -- command line arguments
+        obj {dict} -- context object
+
+    Keyword Arguments:
+        color {bool} -- keep ANSI styles in output (default: {None})
+
+    Returns:
+        int -- exit code
+    """
+    import traceback
+    try:
+        command.main(args, prog_name='vhoster', obj=obj, color=color)
+    except SystemExit as err:
+        return err.code if isinstance(err.code, int) else int(err.code is not None)
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def call(method, params=None, timeout=None):
+    """Send request to running daemon
+
+    Arguments:
+        method {str} -- JSON-RPC method
+
+    Keyword Arguments:
+        params {dict} -- method parameters, token is added (default: {None})
+        timeout {float} -- seconds to wait for response (default: {None})
+
+    Raises:
+        ConnectionError: Daemon is not running or returned an error
+
+    Returns:
+        mixed -- method result
+    """
+    daemon = read_info()
+    if not daemon:
+        raise ConnectionError('Daemon is not running')
+
+    try:
+        if daemon.get('family') == 'unix':
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address = daemon['path']
+        else:
+            conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            address = (daemon['host'], daemon['port'])
+        with conn:
+            conn.settimeout(timeout)
+            conn.connect(address)
+            request = {'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': dict(params or {}, token=daemon.get('token'))}
+            conn.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            with conn.makefile('rb') as f:
+                response = json.loads(f.readline().decode('utf-8'))
+    except (OSError, ValueError, KeyError) as err:
+        raise ConnectionError('Daemon is not reachable: %s' % (str(err) or err.__class__.__name__))
+
+    if 'error' in response:
+        raise ConnectionError(response['error'].get('message', 'Daemon request failed'))
+    return response.get('result')
+
+
+def status(timeout=2):
+    """Return status of running daemon
+
+    Keyword Arguments:
+        timeout {float} -- seconds to wait for response (default: {2})
+
+    Returns:
+        dict -- None if not running
+    """
+    try:
+        return dict(read_info(), **call('ping', timeout=timeout))
+    except ConnectionError:
+        return None
+
+
+def run(args=None):
+    """Command line entry point
+
+    Commands are sent to the daemon when it is running and was started from
+    the same installed package, otherwise (or when reading standard input)
+    they are run in this process.
+
+    Keyword Arguments:
+        args {list} -- command line arguments (default: {sys.argv[1:]})
+    """
+    args = list(sys.argv[1:] if args is None else args)
+    command = next((arg for arg in args if not arg.startswith('-')), None)
+    if command not in LOCAL_COMMANDS and '-' not in args and os.environ.get('VHOSTER_NO_DAEMON') is None:
+        daemon = read_info()
+        if daemon and daemon.get('source') == source_stamp():
+            try:
+                result = call('run', {'args': args, 'cwd': os.getcwd(), 'color': sys.stdout.isatty()})
+            except ConnectionError:
+                result = None
+            if result is not None:
+                import click
+                if result['output']:
+                    click.echo(result['output'], nl=False, color=sys.stdout.isatty())
+                if result['errors']:
+                    click.echo(result['errors'], nl=False, err=True, color=sys.stderr.isatty())
+                sys.exit(result['code'])
+
+    from .cli import main
+    main(args, prog_name='vhoster')
+
+
+def info_path():
+    """Return path to daemon information file
+
+    Returns:
+        str
+    """
+    return app_data('daemon.json')
+
+
+def read_info():
+    """Read daemon information file
+
+    Returns:
+        dict -- empty if daemon is not running
+    """
+    try:
+        with open(info_path(), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def source_stamp():
+    """Return identity of installed package sources
+
+    Checked by every command, so it only stats the package `__init__`
+    module, which is rewritten whenever the package is (re)installed.
+    Restart the daemon after editing other modules in place.
+
+    Returns:
+        list -- [package directory, modification time of `__init__`]
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    return [root, os.stat(os.path.join(root, '__init__.py')).st_mtime_ns]
+
+
+def format_address(address):
+    """Return printable daemon address
+
+    Arguments:
+        address {dict}
+
+    Returns:
+        str
+    """
+    return address['path'] if address.get('family') == 'unix' else '%s:%s' % (address['host'], address['port'])
+
+
+def rpc_error(id, code, message):
+    """Return JSON-RPC error response
+
+    Arguments:
+        id {mixed} -- request id
+        code {int} -- error code
+        message {str}
+
+    Returns:
+        dict
+    """
+    return {'jsonrpc': '2.0', 'id': id, 'error': {'code': code, 'message': message}}
+
+
+if __name__ == '__main__':
+    Daemon().serve()
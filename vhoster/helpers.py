@@ -63,6 +63,36 @@ def valid_filename(s):
     return re.sub(r'(?u)[^-\w.]', '-', s)
 
 
+def atomic_write(path, content):
+    """Replace file contents using a temporary file and rename
+
+    Arguments:
+        path {str} -- path to file
+        content {str|bytes} -- new file contents
+    """
+    import os, shutil, tempfile
+    mode = 'wb' if isinstance(content, bytes) else 'w'
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, temp = tempfile.mkstemp(prefix='.%s.' % name, suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, temp)
+        try:
+            os.replace(temp, path)
+        except PermissionError:
+            # Some system files (e.g. Windows hosts file) cannot be replaced,
+            # only rewritten in place
+            with open(path, mode) as f:
+                f.write(content)
+    finally:
+        if os.path.exists(temp):
+            os.unlink(temp)
+
+
 def dot_get(data, key='', default=None, copy=False):
     """Retrieve key value from data using dot notation
     
@@ -110,11 +140,14 @@ def get_free_tcp_port():
     return port
 
 
-def is_port_open(port):
+def is_port_open(port, timeout=None):
     """Check if port is open
     
     Arguments:
         port {int} -- port
+
+    Keyword Arguments:
+        timeout {float} -- connection timeout in seconds (default: {None})
     
     Returns:
         bool
@@ -122,9 +155,68 @@ def is_port_open(port):
     import socket
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         port = int(port)
+        if timeout is not None:
+            s.settimeout(timeout)
         return not s.connect_ex(('localhost', port)) == 0
 
 
+class PortState:
+    """Port State Service
+
+    Probes ports once per operation, concurrently, and hands out each
+    `Listen` directive only once across all generated site files.
+
+    Keyword Arguments:
+        timeout {float} -- probe timeout in seconds (default: {0.25})
+    """
+
+    def __init__(self, timeout=0.25):
+        self.timeout = timeout
+        self.__open = {}
+        self.__claimed = set()
+
+    def probe(self, ports):
+        """Probe ports that have not been checked yet
+
+        Arguments:
+            ports {iterable} -- ports to check
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        pending = sorted(set(int(p) for p in ports) - set(self.__open))
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(32, len(pending))) as pool:
+                results = pool.map(lambda p: is_port_open(p, self.timeout), pending)
+                self.__open.update(zip(pending, results))
+
+    def isOpen(self, port):
+        """Check if port is open, probing it if needed
+
+        Arguments:
+            port {int} -- port
+
+        Returns:
+            bool
+        """
+        self.probe([port])
+        return self.__open[int(port)]
+
+    def listen(self, ports):
+        """Return open ports that still need a `Listen` directive
+
+        Arguments:
+            ports {iterable} -- ports used by a site
+
+        Returns:
+            list
+        """
+        result = []
+        for port in sorted(set(int(p) for p in ports)):
+            if port not in self.__claimed and self.isOpen(port):
+                self.__claimed.add(port)
+                result.append(port)
+        return result
+
+
 def parse_host(url, default_port:int=None):
     import re
     pattern = r"^(?P<domain>[a-zA-Z0-9.-]+)(:?)(?P<port>[0-9]*?)$"
@@ -148,32 +240,171 @@ def str_replace(string, substitutions: dict):
     return regex.sub(lambda match: substitutions[match.group(0)], string)
 
 
-def run_command(command, quiet=False):
-    """Run shell command using subprocess
-    
+def run_command(command, quiet=False, timeout=None):
+    """Run command using subprocess
+
     Arguments:
-        command {str} -- command to execute
-    
+        command {str|list} -- shell command or argument list
+
     Keyword Arguments:
         quiet {bool} -- suppress output (default: {False})
-    
+        timeout {float} -- seconds before command is killed (default: {None})
+
+    Returns:
+        dict -- {command, returncode, output, errors, elapsed, timedout}
+    """
+    return run_commands([command], quiet=quiet, timeout=timeout)[0]
+
+
+def run_commands(commands, quiet=True, timeout=None, limit=1 << 20):
+    """Run commands concurrently, streaming stdout and stderr as they arrive
+
+    Both pipes are drained at the same time, so a child filling one of them
+    cannot block. Only the last `limit` bytes of each stream are kept.
+    Commands running past the timeout, or when interrupted, are killed.
+
+    Arguments:
+        commands {list} -- shell commands (str) or argument lists (list)
+
+    Keyword Arguments:
+        quiet {bool} -- suppress output (default: {True})
+        timeout {float} -- seconds before each command is killed (default: {None})
+        limit {int} -- bytes kept per stream (default: {1048576})
+
     Returns:
-        dict -- {command, return code, output, errors}
-    """
-    import subprocess, shlex
-    proc = subprocess.Popen(shlex.split(command), shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)    
-    if not quiet:
-        stdout, stderr = b'', b''
-        for line in proc.stdout:
-            stdout += line
-            echo(line.decode(), nl=False)
-        for line in proc.stderr:
-            stderr += line
-            error(line.decode(), nl=False)
-        proc.communicate()
+        list -- {command, returncode, output, errors, elapsed, timedout} per command
+    """
+    import asyncio
+
+    async def gather():
+        return await asyncio.gather(*(_run_async(command, quiet, timeout, limit) for command in commands))
+
+    return asyncio.run(gather())
+
+
+async def _run_async(command, quiet, timeout, limit):
+    """Run a single command inside the event loop
+
+    Returns:
+        dict -- {command, returncode, output, errors, elapsed, timedout}
+    """
+    import asyncio, codecs, shlex, subprocess, time
+
+    async def drain(stream, buffer, printer):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            buffer += chunk
+            if len(buffer) > limit:
+                del buffer[:len(buffer) - limit]
+            if printer:
+                printer(decoder.decode(chunk), nl=False)
+
+    started = time.perf_counter()
+    if isinstance(command, str):
+        proc = await asyncio.create_subprocess_shell(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     else:
-        stdout, stderr = proc.communicate()
-    return {'command': command, 'returncode': proc.returncode, 'output': stdout.decode(), 'errors': stderr.decode()}
+        command = [str(arg) for arg in command]
+        proc = await asyncio.create_subprocess_exec(*command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        command = subprocess.list2cmdline(command) if is_os('Windows') else ' '.join(shlex.quote(arg) for arg in command)
+
+    stdout, stderr = bytearray(), bytearray()
+    timedout = False
+    try:
+        await asyncio.wait_for(asyncio.gather(
+            drain(proc.stdout, stdout, None if quiet else echo),
+            drain(proc.stderr, stderr, None if quiet else error),
+            proc.wait()
+        ), timeout)
+    except asyncio.TimeoutError:
+        timedout = True
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+    return {
+        'command': command,
+        'returncode': proc.returncode,
+        'output': stdout.decode('utf-8', 'replace'),
+        'errors': stderr.decode('utf-8', 'replace'),
+        'elapsed': time.perf_counter() - started,
+        'timedout': timedout
+    }
+
+
+_TEMPLATES = {}
+
+
+def compile_template(name, diskCache=True):
+    """Load compiled template from cache, parsing it only when the resource changes
+
+    Compiled templates are cached per process (validated by resource mtime
+    or content hash) and, optionally, on disk for short-lived invocations.
+
+    Arguments:
+        name {str} -- template name
+
+    Keyword Arguments:
+        diskCache {bool} -- use on-disk cache of parsed templates (default: {True})
+
+    Returns:
+        pyratemp.Template
+    """
+    import hashlib, marshal, os
+    from importlib_resources import read_text
+    from pyratemp import Template
+    from . import templates
+
+    path = os.path.join(os.path.dirname(templates.__file__), name)
+    stamp = os.stat(path).st_mtime_ns if os.path.isfile(path) else None
+    cached = _TEMPLATES.get(name)
+    if cached and stamp is not None and cached[0] == stamp:
+        return cached[2]
+
+    source = read_text(templates, name)
+    digest = hashlib.sha1(source.encode('utf-8')).hexdigest()
+    if cached and cached[1] == digest:
+        _TEMPLATES[name] = (stamp, digest, cached[2])
+        return cached[2]
+
+    compiled = None
+    cachePath = app_data('cache', 'templates', valid_filename(name) + '.marshal') if diskCache else None
+    if cachePath and os.path.isfile(cachePath):
+        try:
+            with open(cachePath, 'rb') as f:
+                cachedDigest, parsetree = marshal.load(f)
+            if cachedDigest == digest:
+                compiled = Template(parsetree=parsetree)
+        except Exception:
+            compiled = None
+
+    if compiled is None:
+        compiled = Template(source)
+        if cachePath:
+            try:
+                with open(cachePath, 'wb') as f:
+                    marshal.dump((digest, compiled.parsetree), f)
+            except Exception:
+                pass
+
+    _TEMPLATES[name] = (stamp, digest, compiled)
+    return compiled
+
+
+def template_digest(name):
+    """Return content hash of template resource
+
+    Arguments:
+        name {str} -- template name
+
+    Returns:
+        str
+    """
+    compile_template(name)
+    return _TEMPLATES[name][1]
 
 
 def template(name, **substitutions):
@@ -185,10 +416,7 @@ def template(name, **substitutions):
     Returns:
         str
     """
-    from importlib_resources import read_text
-    from pyratemp import Template
-    from . import templates
-    return Template(read_text(templates, name))(**substitutions, f={
+    return compile_template(name)(**substitutions, f={
         'parse_host': parse_host,
         'is_port_open': is_port_open
     })
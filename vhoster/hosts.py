@@ -0,0 +1,123 @@
+import os
+from .helpers import *
+from .plan import read_text
+
+BEGIN = '# BEGIN VHoster'
+END = '# END VHoster'
+LEGACY = '#VirtualHost'
+
+
+class HostsFile:
+    """DNS (hosts) File
+
+    All site entries are kept in a single block delimited by `BEGIN` and
+    `END` markers, regenerated from the site store in one pass. Lines
+    outside of the block are left untouched, except entries tagged with
+    `#VirtualHost` by older versions, which are migrated into the block.
+
+    Arguments:
+        path {str} -- path to hosts file
+
+    Keyword Arguments:
+        address {str} -- IP address sites resolve to (default: {'127.0.0.1'})
+    """
+
+    def __init__(self, path, address='127.0.0.1'):
+        self.path = path
+        self.address = address
+
+    def read(self):
+        """Split hosts file around the managed block
+
+        Returns:
+            tuple -- (lines before block, block lines, lines after block)
+        """
+        return split_block(read_text(self.path) or '')
+
+    def entries(self):
+        """Return lines inside the managed block
+
+        Returns:
+            set
+        """
+        return set(line.strip() for line in self.read()[1])
+
+    def render(self, original, records):
+        """Regenerate managed block of hosts file content
+
+        Arguments:
+            original {str} -- current content
+            records {list} -- site records
+
+        Returns:
+            str -- new content
+        """
+        block = [line for record in records for line in host_lines(host_names(record), self.address)]
+
+        before, _, after = split_block(original or '')
+        before = [line for line in before if not line.rstrip().endswith(LEGACY)]
+        after = [line for line in after if not line.rstrip().endswith(LEGACY)]
+
+        lines = before
+        while lines and not lines[-1].strip():
+            lines.pop()
+        if block:
+            lines += [''] + [BEGIN] + block + [END]
+        lines += after
+        return '\n'.join(lines).strip() + '\n'
+
+
+def split_block(content):
+    """Split hosts file content around the managed block
+
+    Arguments:
+        content {str} -- hosts file content
+
+    Returns:
+        tuple -- (lines before block, block lines, lines after block)
+    """
+    lines = content.splitlines()
+    stripped = [line.strip() for line in lines]
+    if BEGIN not in stripped:
+        return lines, [], []
+
+    begin = stripped.index(BEGIN)
+    end = stripped.index(END, begin) if END in stripped[begin:] else len(lines)
+    return lines[:begin], lines[begin + 1:end], lines[end + 1:]
+
+
+def host_names(record):
+    """Return host names of site, without ports
+
+    Arguments:
+        record {SiteRecord} -- site record
+
+    Returns:
+        list -- domain, www alias and mirrors
+    """
+    domain = parse_host(record.domain)['domain']
+    names = [domain, 'www.%s' % domain]
+    for mirror in record.mirrors:
+        host = parse_host(mirror)['domain']
+        if host not in names:
+            names.append(host)
+    return names
+
+
+def host_lines(names, address='127.0.0.1', size=8):
+    """Return hosts file lines mapping names to address
+
+    Windows ignores names past the ninth on a single line, so names are
+    split into lines of at most `size` entries.
+
+    Arguments:
+        names {list} -- host names
+
+    Keyword Arguments:
+        address {str} -- IP address (default: {'127.0.0.1'})
+        size {int} -- names per line (default: {8})
+
+    Returns:
+        list
+    """
+    return ['%s %s' % (address, ' '.join(names[i:i + size])) for i in range(0, len(names), size)]
@@ -0,0 +1,206 @@
+"""Private Key Generation and Pool
+
+Run as `python -m vhoster.keys ALGORITHM SIZE [PATH]` to fill the pool in
+the background.
+"""
+import os, sys
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from vhoster.helpers import *
+from vhoster.lock import FileLock
+
+DEFAULT_ALGORITHM = 'rsa-2048'
+
+ALGORITHMS = {
+    'rsa-2048': lambda: rsa.generate_private_key(65537, 2048, default_backend()),
+    'rsa-3072': lambda: rsa.generate_private_key(65537, 3072, default_backend()),
+    'rsa-4096': lambda: rsa.generate_private_key(65537, 4096, default_backend()),
+    'ecdsa-p256': lambda: ec.generate_private_key(ec.SECP256R1(), default_backend()),
+    'ecdsa-p384': lambda: ec.generate_private_key(ec.SECP384R1(), default_backend()),
+    'ed25519': lambda: ed25519.Ed25519PrivateKey.generate()
+}
+
+ALIASES = {
+    'rsa': 'rsa-2048',
+    'ecdsa': 'ecdsa-p256'
+}
+
+
+def key_algorithm(name=None):
+    """Return canonical key algorithm name
+
+    Keyword Arguments:
+        name {str} -- algorithm name or alias, default if empty (default: {None})
+
+    Raises:
+        ValueError: Unknown algorithm
+
+    Returns:
+        str
+    """
+    name = ALIASES.get((name or DEFAULT_ALGORITHM).lower(), (name or DEFAULT_ALGORITHM).lower())
+    if name not in ALGORITHMS:
+        raise ValueError('Unknown key algorithm: %s (expected one of %s)' % (name, ', '.join(ALGORITHMS)))
+    return name
+
+
+def generate_key(algorithm=None):
+    """Generate private key
+
+    Keyword Arguments:
+        algorithm {str} -- key algorithm (default: {DEFAULT_ALGORITHM})
+
+    Returns:
+        PrivateKey
+    """
+    return ALGORITHMS[key_algorithm(algorithm)]()
+
+
+def key_type(key):
+    """Return algorithm name of private key
+
+    Arguments:
+        key {PrivateKey}
+
+    Returns:
+        str -- None if key type is not supported
+    """
+    if isinstance(key, rsa.RSAPrivateKey):
+        return 'rsa-%d' % key.key_size
+    if isinstance(key, ec.EllipticCurvePrivateKey):
+        return {'secp256r1': 'ecdsa-p256', 'secp384r1': 'ecdsa-p384'}.get(key.curve.name)
+    if isinstance(key, ed25519.Ed25519PrivateKey):
+        return 'ed25519'
+    return None
+
+
+def key_bytes(key):
+    """Return PEM encoded private key
+
+    Ed25519 keys have no traditional OpenSSL encoding and are written as PKCS8.
+
+    Arguments:
+        key {PrivateKey}
+
+    Returns:
+        bytes
+    """
+    fmt = serialization.PrivateFormat.PKCS8 if isinstance(key, ed25519.Ed25519PrivateKey) \
+        else serialization.PrivateFormat.TraditionalOpenSSL
+    return key.private_bytes(serialization.Encoding.PEM, fmt, serialization.NoEncryption())
+
+
+def load_pooled_key(data):
+    """Load PEM encoded key generated by the key pool
+
+    RSA key validation is skipped where supported (cryptography 39+), as it
+    takes longer than signing and pool keys were generated locally.
+
+    Arguments:
+        data {bytes} -- PEM encoded private key
+
+    Returns:
+        PrivateKey
+    """
+    try:
+        return serialization.load_pem_private_key(data, None, default_backend(), unsafe_skip_rsa_key_validation=True)
+    except TypeError:
+        return serialization.load_pem_private_key(data, None, default_backend())
+
+
+class KeyPool:
+    """Pre-generated Private Key Pool
+
+    Keeps a number of unused private keys per algorithm on disk so that
+    certificates can be signed without waiting for key generation. Keys
+    are claimed by renaming their file, which is safe across processes.
+
+    Keyword Arguments:
+        algorithm {str} -- key algorithm (default: {DEFAULT_ALGORITHM})
+        size {int} -- number of keys to keep (default: {8})
+        path {str} -- pool directory (default: {app_data('certs', 'pool')})
+    """
+
+    def __init__(self, algorithm=None, size=8, path=None):
+        self.algorithm = key_algorithm(algorithm)
+        self.size = int(size)
+        self.path = os.path.join(path or app_data('certs', 'pool'), self.algorithm)
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        """Return paths of available keys
+
+        Returns:
+            list
+        """
+        try:
+            return sorted(os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith('.key'))
+        except FileNotFoundError:
+            return []
+
+    def take(self):
+        """Claim a key from the pool
+
+        Returns:
+            PrivateKey -- None if pool is empty
+        """
+        for keyPath in self.keys():
+            claimed = '%s.%d.claimed' % (keyPath, os.getpid())
+            try:
+                os.rename(keyPath, claimed)
+            except OSError:
+                continue
+            try:
+                with open(claimed, 'rb') as f:
+                    return load_pooled_key(f.read())
+            except (OSError, ValueError):
+                continue
+            finally:
+                if os.path.exists(claimed):
+                    os.remove(claimed)
+        return None
+
+    def fill(self):
+        """Generate keys until pool is full, unless another process is filling it
+
+        Returns:
+            int -- number of keys generated
+        """
+        os.makedirs(self.path, exist_ok=True)
+        lock = FileLock(os.path.join(self.path, '.fill.lock'), blocking=False)
+        if not lock.acquire():
+            return 0
+
+        generated = 0
+        try:
+            while len(self) < self.size:
+                atomic_write(os.path.join(self.path, '%s.key' % os.urandom(8).hex()), key_bytes(generate_key(self.algorithm)))
+                generated += 1
+        finally:
+            lock.release()
+        return generated
+
+    def refill(self):
+        """Fill pool in a detached background process, if not full
+
+        Returns:
+            bool -- True if a process was started
+        """
+        if self.size <= 0 or len(self) >= self.size or getattr(sys, 'frozen', False):
+            return False
+
+        import subprocess
+        options = {'creationflags': 0x00000008 | 0x00000200} if is_os('Windows') else {'start_new_session': True}
+        subprocess.Popen(
+            [sys.executable, '-m', 'vhoster.keys', self.algorithm, str(self.size), os.path.dirname(self.path)],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), **options
+        )
+        return True
+
+
+if __name__ == '__main__':
+    KeyPool(sys.argv[1], int(sys.argv[2]), sys.argv[3] if len(sys.argv) > 3 else None).fill()
@@ -0,0 +1,147 @@
+import os, threading
+from .helpers import *
+
+
+class FileLock:
+    """Advisory File Lock
+
+    Supports shared (reader) and exclusive (writer) locking using `fcntl`
+    (`msvcrt` on Windows, where every lock is exclusive). Locks are
+    re-entrant within a thread: nested acquisitions reuse the held lock,
+    upgrading it to exclusive if needed.
+
+    Arguments:
+        path {str} -- path to lock file
+
+    Keyword Arguments:
+        shared {bool} -- acquire shared (reader) lock (default: {False})
+        blocking {bool} -- wait until lock is available (default: {True})
+    """
+
+    __held = {}
+    __mutex = threading.Lock()
+
+    def __init__(self, path, shared=False, blocking=True):
+        self.path = os.path.abspath(path)
+        self.shared = shared
+        self.blocking = blocking
+        self.__locked = False
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    @property
+    def locked(self):
+        """Check if lock is held by this instance
+
+        Returns:
+            bool
+        """
+        return self.__locked
+
+    @property
+    def key(self):
+        """Return registry key of lock (per path and thread)
+
+        Returns:
+            tuple
+        """
+        return (self.path, threading.get_ident())
+
+    def acquire(self, blocking=None):
+        """Acquire lock
+
+        Keyword Arguments:
+            blocking {bool} -- override instance blocking mode (default: {None})
+
+        Returns:
+            bool -- False if lock is held elsewhere and blocking is disabled
+        """
+        if self.locked:
+            return True
+
+        blocking = self.blocking if blocking is None else blocking
+        with FileLock.__mutex:
+            held = FileLock.__held.get(self.key)
+
+        if held is not None:
+            # Windows locks are always exclusive, no upgrade needed
+            if held['shared'] and not self.shared and not is_os('Windows'):
+                if not self.__lock(held['fd'], False, blocking):
+                    return False
+                held['shared'] = False
+            held['depth'] += 1
+            self.__locked = True
+            return True
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        if not self.__lock(fd, self.shared, blocking):
+            os.close(fd)
+            return False
+
+        with FileLock.__mutex:
+            FileLock.__held[self.key] = {'fd': fd, 'shared': self.shared, 'depth': 1}
+        self.__locked = True
+        return True
+
+    def release(self):
+        """Release lock, if held"""
+        if not self.locked:
+            return
+
+        self.__locked = False
+        with FileLock.__mutex:
+            held = FileLock.__held[self.key]
+            held['depth'] -= 1
+            if held['depth']:
+                return
+            del FileLock.__held[self.key]
+
+        try:
+            if is_os('Windows'):
+                import msvcrt
+                os.lseek(held['fd'], 0, os.SEEK_SET)
+                msvcrt.locking(held['fd'], msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(held['fd'], fcntl.LOCK_UN)
+        finally:
+            os.close(held['fd'])
+
+    def __lock(self, fd, shared, blocking):
+        """Apply operating system lock to file descriptor
+
+        Returns:
+            bool -- False if lock is held elsewhere and blocking is disabled
+        """
+        try:
+            if is_os('Windows'):
+                import msvcrt
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+                fcntl.flock(fd, mode | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            if blocking:
+                raise
+            return False
+        return True
+
+
+def lock_path(path):
+    """Return path to lock file guarding given file
+
+    Arguments:
+        path {str} -- path to guarded file
+
+    Returns:
+        str
+    """
+    return app_data('locks', valid_filename(os.path.abspath(path).strip('/\\')) + '.lock')
@@ -0,0 +1,191 @@
+import hashlib, json, os
+from .bundle import Bundle, config_name, read_sections
+from .certindex import CertificateIndex, file_stamp
+from .helpers import *
+from .hosts import HostsFile
+from .plan import Plan
+from .transaction import Transaction
+
+
+class Manifest:
+    """Rebuild Manifest
+
+    Records a hash of each site's inputs, rendered configuration, hosts
+    entries and certificate fingerprint so `rebuild` can skip unchanged sites.
+    Shard files and the certificate index are read once and shared by all
+    sites, until they change on disk.
+
+    Keyword Arguments:
+        path {str} -- path to manifest file (default: {app_data('manifest.json')})
+    """
+
+    def __init__(self, path=None):
+        self.path = path or app_data('manifest.json')
+        self.__sites = {}
+        self.__shards = {}
+        self.__index = None
+        self.__indexStamp = None
+        self.__store = None
+        self.load()
+
+    def load(self):
+        """Load manifest from file, if exists"""
+        try:
+            with open(self.path, 'r') as f:
+                self.__sites = json.load(f).get('sites', {})
+        except (OSError, ValueError, AttributeError):
+            self.__sites = {}
+
+    def save(self):
+        """Save manifest to file, unless in dry-run mode"""
+        if Plan.recording() is not None:
+            return
+        atomic_write(self.path, json.dumps({'sites': self.__sites}, indent=4, sort_keys=True))
+
+    def state(self, site, hosts):
+        """Compute current state of site
+
+        Arguments:
+            site {Site} -- site instance
+            hosts {set} -- lines currently in managed block of DNS (hosts) file
+
+        Returns:
+            dict -- {inputs, conf, hosts, cert}
+        """
+        inputs = json.dumps([
+            site.toDict(),
+            site.confPath(),
+            site.documentRoot(),
+            site.certPath(),
+            site.certKeyPath(),
+            site.config.get('apache.bundle'),
+            template_digest('site.conf')
+        ], sort_keys=True)
+
+        bundle = Bundle(site.config)
+        if bundle.enabled:
+            name = config_name(site.confPath())
+            section = self.sections(bundle.shardPath(name)).get(name)
+            conf = sha1(section) if section is not None else None
+        else:
+            conf = file_hash(site.confPath())
+
+        entries = site.hostEntries()
+        return {
+            'inputs': sha1(inputs),
+            'conf': conf,
+            'hosts': sha1('\n'.join(entries)) if hosts.issuperset(entries) else None,
+            'cert': self.certificate(site).getFingerprint(site.certPath()) if site.secure else None
+        }
+
+    def sections(self, shardPath):
+        """Return site sections of shard file, parsed again only if it changed
+
+        Arguments:
+            shardPath {str} -- path to shard file
+
+        Returns:
+            dict -- {name: section content}
+        """
+        stamp = file_stamp(shardPath)
+        cached = self.__shards.get(shardPath)
+        if cached is None or cached[0] != stamp:
+            cached = self.__shards[shardPath] = (stamp, read_sections(shardPath))
+        return cached[1]
+
+    def certificate(self, site):
+        """Return certificate toolkit of site, sharing one trust store and index
+
+        The index is only read; entries it learns are saved by transactions.
+
+        Arguments:
+            site {Site} -- site instance
+
+        Returns:
+            Certificate
+        """
+        if Transaction.current() is not None:
+            return site.certificate
+
+        from .certificate import Certificate
+        from .truststore import trust_store
+        path = app_data('certs', 'index.json')
+        if self.__index is None or self.__indexStamp != file_stamp(path):
+            self.__index, self.__indexStamp = CertificateIndex(path), file_stamp(path)
+        if self.__store is None:
+            self.__store = trust_store(site.config.get('certs.truststore'))
+        return Certificate(site.domain, store=self.__store, index=self.__index)
+
+    def changed(self, site, hosts):
+        """Check if site state differs from the recorded one
+
+        Arguments:
+            site {Site} -- site instance
+            hosts {set} -- lines currently in managed block of DNS (hosts) file
+
+        Returns:
+            bool
+        """
+        recorded = self.__sites.get(site.domain)
+        return recorded is None or recorded != self.state(site, hosts)
+
+    def record(self, site, hosts):
+        """Record current state of site
+
+        Arguments:
+            site {Site} -- site instance
+            hosts {set} -- lines currently in managed block of DNS (hosts) file
+        """
+        self.__sites[site.domain] = self.state(site, hosts)
+
+    def prune(self, domains):
+        """Forget sites not in domains
+
+        Arguments:
+            domains {iterable} -- registered site domains
+        """
+        domains = set(domains)
+        self.__sites = {k: v for k, v in self.__sites.items() if k in domains}
+
+
+def sha1(text):
+    """Return SHA1 hex digest of text
+
+    Arguments:
+        text {str}
+
+    Returns:
+        str
+    """
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def file_hash(path):
+    """Return SHA1 hex digest of file contents
+
+    Arguments:
+        path {str} -- path to file
+
+    Returns:
+        str -- None if file does not exist
+    """
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def hosts_lines(path):
+    """Return stripped lines of managed block in DNS (hosts) file
+
+    Arguments:
+        path {str} -- path to hosts file
+
+    Returns:
+        set
+    """
+    try:
+        return HostsFile(path).entries()
+    except OSError:
+        return set()
@@ -0,0 +1,240 @@
+from contextlib import contextmanager
+import difflib, os
+from .helpers import *
+from .lock import FileLock, lock_path
+
+
+class FileChange:
+    """Planned File Change
+
+    Arguments:
+        path {str} -- path to file
+        before {str} -- content when planned, None if missing
+        after {str} -- planned content, None to delete
+
+    Keyword Arguments:
+        render {callable} -- recomputes content from the current one, for files shared with other processes (default: {None})
+        title {str} -- title of file name printed when applied (default: {None})
+        message {str} -- message printed when applied, instead of file name (default: {None})
+    """
+
+    def __init__(self, path, before, after, render=None, title=None, message=None):
+        self.path = path
+        self.before = before
+        self.after = after
+        self.render = render
+        self.title = title
+        self.message = message
+
+    @property
+    def action(self):
+        """Return change type
+
+        Returns:
+            str -- 'create', 'delete', 'modify' or None if unchanged
+        """
+        if self.before == self.after:
+            return None
+        if self.before is None:
+            return 'create'
+        return 'delete' if self.after is None else 'modify'
+
+    def diff(self):
+        """Return unified diff of change
+
+        Returns:
+            list -- diff lines
+        """
+        return list(difflib.unified_diff(
+            (self.before or '').splitlines(), (self.after or '').splitlines(),
+            '/dev/null' if self.before is None else 'a' + os.sep + self.path.lstrip('/\\'),
+            '/dev/null' if self.after is None else 'b' + os.sep + self.path.lstrip('/\\'),
+            lineterm=''
+        ))
+
+    def apply(self):
+        """Write planned content
+
+        Shared files are locked and, if they were modified since the change
+        was planned, the content is rendered again from the current one.
+
+        Returns:
+            bool -- True if file was modified
+        """
+        if self.render is None:
+            return self.__write(read_text(self.path), self.after)
+
+        with FileLock(lock_path(self.path)):
+            current = read_text(self.path)
+            return self.__write(current, self.after if current == self.before else self.render(current))
+
+    def report(self):
+        """Print message of applied change"""
+        if self.message:
+            echo(self.message)
+        elif self.title:
+            info(os.path.basename(self.path), title=self.title)
+
+    def __write(self, current, content):
+        if content == current:
+            return False
+        if content is None:
+            os.remove(self.path)
+        else:
+            atomic_write(self.path, content)
+        return True
+
+
+class Plan:
+    """System Change Plan
+
+    Transactions compute every file change (site configurations, bundle
+    shards, Include lines and the hosts block), certificate action and
+    command in memory first, then apply the plan. In dry-run mode, plans
+    of all transactions are merged into the recording plan and printed
+    instead, without touching any file or running any command.
+    """
+
+    __recording = []
+
+    def __init__(self):
+        self.files = {}
+        self.actions = []
+
+    def __len__(self):
+        return len(self.changes()) + len(self.actions)
+
+    @classmethod
+    def recording(cls):
+        """Return the plan collecting dry-run changes
+
+        Returns:
+            Plan -- None if changes are applied
+        """
+        return cls.__recording[-1] if cls.__recording else None
+
+    @classmethod
+    @contextmanager
+    def record(cls):
+        """Collect changes of all transactions instead of applying them
+
+        Yields:
+            Plan
+        """
+        plan = cls()
+        cls.__recording.append(plan)
+        try:
+            yield plan
+        finally:
+            cls.__recording.remove(plan)
+
+    def read(self, path):
+        """Return file content as planned so far
+
+        Arguments:
+            path {str} -- path to file
+
+        Returns:
+            str -- None if file is (planned to be) missing
+        """
+        if path in self.files:
+            return self.files[path].after
+        return read_text(path)
+
+    def write(self, path, content, render=None, title=None, message=None):
+        """Plan file content
+
+        Arguments:
+            path {str} -- path to file
+            content {str} -- new content, None to delete
+
+        Keyword Arguments:
+            render {callable} -- recomputes content from the current one (default: {None})
+            title {str} -- title of file name printed when applied (default: {None})
+            message {str} -- message printed when applied (default: {None})
+
+        Returns:
+            FileChange
+        """
+        change = self.files.get(path)
+        if change is None:
+            change = self.files[path] = FileChange(path, read_text(path), content, render, title, message)
+        else:
+            change.after = content
+            change.render = render or change.render
+            change.title, change.message = title or change.title, message or change.message
+        return change
+
+    def delete(self, path, title=None):
+        """Plan file removal
+
+        Arguments:
+            path {str} -- path to file
+
+        Keyword Arguments:
+            title {str} -- title of file name printed when applied (default: {None})
+
+        Returns:
+            FileChange
+        """
+        return self.write(path, None, title=title)
+
+    def action(self, title, subject):
+        """Plan action other than a file change
+
+        Arguments:
+            title {str} -- action, like 'Create Certificate'
+            subject {str} -- object of the action
+        """
+        self.actions.append((title, subject))
+
+    def command(self, *args):
+        """Plan command execution
+
+        Arguments:
+            args {str} -- command line
+        """
+        self.action('Run', ' '.join(args))
+
+    def changes(self):
+        """Return planned file changes that modify files
+
+        Returns:
+            list -- list of FileChange
+        """
+        return [change for change in self.files.values() if change.action]
+
+    def show(self):
+        """Print planned changes followed by their diffs"""
+        if not len(self):
+            info('No changes')
+            return
+
+        marks = {'create': ('A', 'green'), 'delete': ('D', 'red'), 'modify': ('M', 'yellow')}
+        for change in self.changes():
+            mark, style = marks[change.action]
+            echo(change.path, title=mark, style=style, pre='  ')
+        for title, subject in self.actions:
+            echo(subject, title=title, style='cyan', pre='  ')
+
+        styles = {'+': 'green', '-': 'red', '@': 'cyan'}
+        for change in self.changes():
+            echo('')
+            for line in change.diff():
+                echo(line, style=None if line[:3] in ('---', '+++') else styles.get(line[:1]))
+
+
+def read_text(path):
+    """Read text file
+
+    Arguments:
+        path {str} -- path to file
+
+    Returns:
+        str -- None if file does not exist
+    """
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except (FileNotFoundError, IsADirectoryError):
+        return None
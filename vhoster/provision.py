@@ -0,0 +1,175 @@
+"""Site Manifests
+
+Site definitions are read from and written to JSON or CSV files:
+
+    {"sites": [{"domain": "app.test", "path": "app", "root": "public", "secure": true, "mirrors": ["api.test"]}]}
+
+    domain,path,root,secure,mirrors
+    app.test,app,public,yes,api.test
+
+Relative paths are resolved against the directory of the manifest.
+"""
+import csv, json, os, re
+from .helpers import *
+from .site import SiteRecord, SiteStore
+from .errors import *
+
+FIELDS = ['domain', 'path', 'root', 'secure', 'mirrors']
+
+DOMAIN = re.compile(r'^[A-Za-z0-9_]([A-Za-z0-9_.-]*[A-Za-z0-9_])?(:\d{1,5})?$')
+
+
+def manifest_format(path, format=None):
+    """Return manifest format from explicit format or file extension
+
+    Arguments:
+        path {str} -- path to manifest, '-' for standard streams
+
+    Keyword Arguments:
+        format {str} -- 'json' or 'csv' (default: {None})
+
+    Returns:
+        str
+    """
+    if format:
+        return format.lower()
+    return 'csv' if str(path).lower().endswith('.csv') else 'json'
+
+
+def read_manifest(path, format=None):
+    """Read site definitions from manifest
+
+    Arguments:
+        path {str} -- path to manifest, '-' for standard input
+
+    Keyword Arguments:
+        format {str} -- 'json' or 'csv' (default: {detected from extension})
+
+    Raises:
+        ValueError: Manifest cannot be parsed
+
+    Returns:
+        list -- list of dict
+    """
+    import click
+    base = os.getcwd() if path == '-' else os.path.dirname(os.path.abspath(path))
+    with click.open_file(path, 'r', encoding='utf-8') as f:
+        if manifest_format(path, format) == 'csv':
+            entries = list(csv.DictReader(f))
+        else:
+            data = json.load(f)
+            entries = data.get('sites', []) if isinstance(data, dict) else data
+
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        raise ValueError('Manifest must contain a list of sites')
+    return [normalize_entry(entry, base) for entry in entries]
+
+
+def write_manifest(records, path='-', format=None):
+    """Write site records to manifest
+
+    Arguments:
+        records {list} -- list of SiteRecord
+
+    Keyword Arguments:
+        path {str} -- path to manifest, '-' for standard output (default: {'-'})
+        format {str} -- 'json' or 'csv' (default: {detected from extension})
+    """
+    import click
+    sites = [record.toDict() for record in records]
+    if manifest_format(path, format) == 'csv':
+        with click.open_file(path, 'w', encoding='utf-8', atomic=path != '-') as f:
+            writer = csv.DictWriter(f, FIELDS, lineterminator='\n')
+            writer.writeheader()
+            for site in sites:
+                writer.writerow(dict(site, secure='yes' if site['secure'] else 'no', mirrors=' '.join(site['mirrors'])))
+    else:
+        with click.open_file(path, 'w', encoding='utf-8', atomic=path != '-') as f:
+            f.write(json.dumps({'sites': sites}, indent=4) + '\n')
+
+
+def normalize_entry(entry, base):
+    """Convert manifest entry to site data
+
+    Arguments:
+        entry {dict} -- raw manifest entry
+        base {str} -- directory relative paths are resolved against
+
+    Returns:
+        dict -- {domain, path, root, secure, mirrors}
+    """
+    secure = entry.get('secure', False)
+    if isinstance(secure, str):
+        secure = secure.strip().lower() in ('1', 'true', 'yes', 'y', 'on')
+
+    mirrors = entry.get('mirrors') or []
+    if isinstance(mirrors, str):
+        mirrors = re.split(r'[\s,;]+', mirrors)
+
+    path = str(entry.get('path') or '').strip()
+    return {
+        'domain': str(entry.get('domain') or '').strip(),
+        'path': os.path.abspath(os.path.join(base, path)) if path else '',
+        'root': str(entry.get('root') or '').strip(),
+        'secure': bool(secure),
+        'mirrors': [str(mirror).strip() for mirror in mirrors if str(mirror).strip()]
+    }
+
+
+def plan_import(entries, store: SiteStore, update=False):
+    """Validate site definitions against each other and registered sites
+
+    Duplicates are detected with in-memory indexes of the manifest and the
+    indexed site store, without touching configuration files.
+
+    Arguments:
+        entries {list} -- site data, as returned by read_manifest()
+        store {SiteStore} -- site store
+
+    Keyword Arguments:
+        update {bool} -- replace registered sites with the same domain (default: {False})
+
+    Returns:
+        tuple -- (list of (site ID or None, SiteRecord), list of (entry number, error message))
+    """
+    accepted, errors = [], []
+    names, paths = {}, {}
+    for number, entry in enumerate(entries, 1):
+        problems = []
+        domain, path = entry['domain'], entry['path']
+        if not domain or not DOMAIN.match(domain):
+            problems.append("Invalid domain '%s'" % domain)
+        if not path:
+            problems.append('Path is required')
+        elif not os.path.isdir(path):
+            problems.append("Path '%s' is not a directory" % path)
+
+        id, existing = store.find(domain=domain) if domain else (None, None)
+        if existing is not None and not update:
+            problems.append(str(SiteExistsError(domain=domain)))
+        if domain and store.findMirror(domain, ignore=id) != (None, None):
+            problems.append(str(SiteExistsError(domain=domain)))
+
+        for mirror in entry['mirrors']:
+            if not DOMAIN.match(mirror):
+                problems.append("Invalid mirror '%s'" % mirror)
+            elif store.find(domain=mirror, ignore=id) != (None, None) or store.findMirror(mirror, ignore=id) != (None, None):
+                problems.append(str(SiteExistsError(domain=mirror)))
+
+        for name in [domain] + entry['mirrors']:
+            if name in names:
+                problems.append("'%s' is already defined by entry %d" % (name, names[name]))
+        if path in paths:
+            problems.append("Path '%s' is already used by entry %d" % (path, paths[path]))
+        elif path and store.find(path=path, ignore=id) != (None, None):
+            problems.append(str(SiteExistsError(path=path)))
+
+        for name in [domain] + entry['mirrors']:
+            names.setdefault(name, number)
+        paths.setdefault(path, number)
+
+        if problems:
+            errors.extend((number, problem) for problem in problems)
+        else:
+            accepted.append((id, SiteRecord.fromDict(entry)))
+    return accepted, errors
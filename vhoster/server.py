@@ -1,6 +1,8 @@
-import subprocess, os
+import subprocess, os, time
 from .helpers import *
 from .config import Config
+from .lock import FileLock
+from .plan import Plan
 
 class Server:
     """Apache Server Driver
@@ -9,6 +11,10 @@ class Server:
         config {Config} -- configuration instance
     """
 
+    # Set by the daemon to a callable receiving the server, reloads are then
+    # scheduled instead of run, so that bulk operations reload only once
+    deferred = None
+
     def __init__(self, config: Config):
         self.config = config
 
@@ -21,13 +27,17 @@ class Server:
         """
         return self.config.get('apache.bin', 'httpd')
 
-    def run(self, *args):
+    def run(self, *args, quiet=False, timeout=None):
         """Run apache commands
-        
+
+        Keyword Arguments:
+            quiet {bool} -- suppress output (default: {False})
+            timeout {float} -- seconds before command is killed (default: {None})
+
         Returns:
-            dict -- {command, returncode, output, errors}
+            dict -- {command, returncode, output, errors, elapsed, timedout}
         """
-        return run_command('"{bin}" {args}'.format(bin=self.path, args=' '.join(args)))
+        return run_command([self.path] + list(args), quiet, timeout=timeout)
 
     def start(self):
         """Start apache service"""
@@ -42,4 +52,87 @@ class Server:
     def restart(self):
         """Restart apache service"""
         self.run('-k', 'restart')
-        success('Apache service restarted')
\ No newline at end of file
+        success('Apache service restarted')
+
+    def check(self):
+        """Check apache configuration syntax
+
+        Returns:
+            bool
+        """
+        command = self.run('-t', quiet=True, timeout=60)
+        if command['returncode'] != 0:
+            error('Apache configuration test failed')
+            warn('\n' + template('cmd.txt', **command))
+            return False
+        return True
+
+    def reload(self, debounce=0.5):
+        """Gracefully reload apache service
+
+        Reloads from concurrent or back-to-back invocations are coalesced:
+        the process holding the reload lock waits for the debounce window
+        and reloads again if new requests arrived meanwhile, others return
+        immediately.
+
+        In dry-run mode, the reload is added to the recording plan instead.
+
+        Keyword Arguments:
+            debounce {float} -- seconds to wait for other reload requests (default: {0.5})
+
+        Returns:
+            bool -- False if configuration test failed
+        """
+        plan = Plan.recording()
+        if plan is not None:
+            plan.command(self.path, '-k', 'restart' if is_os('Windows') else 'graceful')
+            return True
+
+        if Server.deferred is not None:
+            Server.deferred(self)
+            info('Apache reload scheduled')
+            return True
+
+        requestPath = app_data('locks', 'reload.request')
+        atomic_write(requestPath, repr(time.time()))
+        lock = FileLock(app_data('locks', 'reload.lock'), blocking=False)
+
+        reloaded = False
+        while lock.acquire():
+            try:
+                time.sleep(debounce)
+                started = time.time()
+                if not self.check():
+                    warn('Apache service was not reloaded')
+                    return False
+                command = self.run('-k', 'restart' if is_os('Windows') else 'graceful', quiet=True, timeout=60)
+                if command['returncode'] != 0:
+                    error('Apache service reload failed')
+                    warn('\n' + template('cmd.txt', **command))
+                    return False
+                success('Apache service reloaded (%.2fs)' % command['elapsed'])
+                reloaded = True
+            finally:
+                lock.release()
+
+            if self.lastRequest(requestPath) <= started:
+                return True
+
+        if not reloaded:
+            info('Apache reload is already pending')
+        return True
+
+    def lastRequest(self, requestPath):
+        """Return time of latest reload request
+
+        Arguments:
+            requestPath {str} -- path to reload request file
+
+        Returns:
+            float
+        """
+        try:
+            with open(requestPath, 'r') as f:
+                return float(f.read())
+        except (OSError, ValueError):
+            return 0.0
\ No newline at end of file
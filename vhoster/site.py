@@ -1,15 +1,104 @@
 from .config import Config
 from .server import Server
-from .certificate import Certificate
+from .transaction import Transaction
+from .hosts import host_lines, host_names
 from .errors import *
 from .helpers import *
-from copy import deepcopy
 import os
 
 
+class SiteRecord:
+    """Immutable Site Record
+
+    Arguments:
+        domain {str} -- site domain name
+        path {str} -- path to site directory
+
+    Keyword Arguments:
+        root {str} -- site document root (default: {''})
+        secure {bool} -- enable SSL/TLS configuration (default: {False})
+        mirrors {tuple} -- mirror domain names (default: {()})
+    """
+
+    __slots__ = ('domain', 'path', 'root', 'secure', 'mirrors')
+
+    def __init__(self, domain, path, root='', secure=False, mirrors=()):
+        set = object.__setattr__
+        set(self, 'domain', domain)
+        set(self, 'path', path)
+        set(self, 'root', root or '')
+        set(self, 'secure', bool(secure))
+        set(self, 'mirrors', tuple(mirrors or ()))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("'%s' object is immutable" % self.__class__.__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError("'%s' object is immutable" % self.__class__.__name__)
+
+    def __repr__(self):
+        return "%s(domain='%s', path='%s', root='%s', secure=%s, mirrors=%s)" % (
+            self.__class__.__name__, self.domain, self.path, self.root, self.secure, self.mirrors)
+
+    def __eq__(self, other):
+        if not isinstance(other, SiteRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (self.__class__, tuple(getattr(self, name) for name in self.__slots__))
+
+    @classmethod
+    def fromDict(cls, data):
+        """Create record from serialized site data
+
+        Arguments:
+            data {dict} -- site data
+
+        Returns:
+            SiteRecord
+        """
+        return cls(data['domain'], data['path'], data.get('root', ''), data.get('secure', False), data.get('mirrors', ()))
+
+    def toDict(self):
+        """Return record as serializable dictionary
+
+        Returns:
+            dict
+        """
+        return {
+            'domain': self.domain,
+            'path': self.path,
+            'root': self.root,
+            'secure': self.secure,
+            'mirrors': list(self.mirrors)
+        }
+
+    def replace(self, **kwargs):
+        """Return copy of record with given fields replaced
+
+        Returns:
+            SiteRecord
+        """
+        return SiteRecord(**{**{name: getattr(self, name) for name in self.__slots__}, **kwargs})
+
+
 class SiteStore:
     """Site Storage Provider
 
+    Sites are kept as immutable records, converted to dictionaries only when
+    the configuration is serialized, and indexed by domain, path and mirror
+    hostname so lookups do not need to scan the whole store.
+
     Arguments:
             config {Config} -- configuration instance
     """
@@ -17,14 +106,82 @@ class SiteStore:
     def __init__(self, config: Config):
         self.__config = config
         self.__store = self.__config.get('sites')
+        if self.__store is None:
+            self.__store = []
+        for id, site in enumerate(self.__store):
+            if not isinstance(site, SiteRecord):
+                self.__store[id] = SiteRecord.fromDict(site)
+        self.reindex()
+
+    def reindex(self):
+        """Rebuild domain, path and mirror indexes from the store"""
+        self.__domains = {}
+        self.__paths = {}
+        self.__mirrors = {}
+        for id, site in enumerate(self.__store):
+            self.__index(id, site)
+
+    def isCurrent(self):
+        """Check if store still wraps the site list of the configuration
+
+        The list is replaced when the configuration is reloaded from disk.
+
+        Returns:
+            bool
+        """
+        sites = self.__config.get('sites')
+        return sites is self.__store or (sites is None and not self.__store)
+
+    def __index(self, id, site):
+        """Add site to indexes
+
+        Arguments:
+            id {int} -- site ID
+            site {SiteRecord} -- site record
+        """
+        self.__domains.setdefault(site.domain, id)
+        self.__paths.setdefault(os.path.abspath(site.path), []).append(id)
+        for mirror in site.mirrors:
+            self.__mirrors.setdefault(mirror, id)
+
+    def __unindex(self, id, site):
+        """Remove site from indexes
+
+        Arguments:
+            id {int} -- site ID
+            site {SiteRecord} -- site record
+        """
+        if self.__domains.get(site.domain) == id:
+            del self.__domains[site.domain]
+        ids = self.__paths.get(os.path.abspath(site.path), [])
+        if id in ids:
+            ids.remove(id)
+            if not ids:
+                del self.__paths[os.path.abspath(site.path)]
+        for mirror in site.mirrors:
+            if self.__mirrors.get(mirror) == id:
+                del self.__mirrors[mirror]
 
     def all(self):
         """Get all sites
 
         Returns:
-            list
+            list -- list of SiteRecord
         """
-        return deepcopy(self.__store)
+        return list(self.__store)
+
+    def records(self, path=None):
+        """Get records of all sites (or sites linked to path)
+
+        Keyword Arguments:
+            path {str} -- site path (default: {None})
+
+        Returns:
+            list -- list of (id, SiteRecord)
+        """
+        if path is not None:
+            return [(id, self.__store[id]) for id in self.__paths.get(os.path.abspath(path), [])]
+        return list(enumerate(self.__store))
 
     def create(self, **kwargs):
         """Create new site with given parameters and data
@@ -32,7 +189,13 @@ class SiteStore:
         Returns:
             int -- ID of newly created site
         """
-        self.__store.append(kwargs)
+        if self.__config.get('sites') is None:
+            self.__config.set('sites', self.__store)
+
+        record = SiteRecord.fromDict(kwargs)
+        self.__store.append(record)
+        self.__index(len(self.__store) - 1, record)
+        self.__config.touch()
         self.__config.save()
         return len(self.__store) - 1
 
@@ -46,15 +209,37 @@ class SiteStore:
             ignore {int} -- ignore site with this ID
 
         Returns:
-            tuple -- site id and data, (None, None) if not found
+            tuple -- site id and SiteRecord, (None, None) if not found
         """
-        if id in range(len(self.__store)):
-            return id, deepcopy(self.__store[id])
+        if id is not None and id in range(len(self.__store)):
+            return id, self.__store[id]
 
-        for i, site in enumerate(self.__store):
-            if (site['domain'] == domain) or (site['path'] == path):
-                if ignore == None or ignore != i:
-                    return i, deepcopy(site)
+        found = self.__domains.get(domain)
+        if found is not None and found != ignore:
+            return found, self.__store[found]
+
+        if path is not None:
+            for found in self.__paths.get(os.path.abspath(path), []):
+                if found != ignore:
+                    return found, self.__store[found]
+
+        return None, None
+
+    def findMirror(self, domain, ignore=None):
+        """Find existing site that is mirrored to domain
+
+        Arguments:
+            domain {str} -- mirror domain
+
+        Keyword Arguments:
+            ignore {int} -- ignore site with this ID
+
+        Returns:
+            tuple -- site id and SiteRecord, (None, None) if not found
+        """
+        found = self.__mirrors.get(domain)
+        if found is not None and found != ignore:
+            return found, self.__store[found]
 
         return None, None
 
@@ -62,20 +247,16 @@ class SiteStore:
         """Get sites matching specified path                
 
         Keyword Arguments:
-            domain {str} -- site domain (default: {None})
             path {str} -- site path (default: {None})
             ignore {int} -- ignore site with this ID
 
         Returns:
-            dict -- {id: data}
+            dict -- {id: SiteRecord}
         """
-        result = {}
-        for i, site in enumerate(self.__store):
-            if (site['path'] == path):
-                if ignore == None or ignore != i:
-                    result[i] = deepcopy(site)
+        if path is None:
+            return {}
 
-        return result
+        return {i: self.__store[i] for i in self.__paths.get(os.path.abspath(path), []) if i != ignore}
 
     def update(self, id: int, **kwargs):
         """Update existing site values with specified parameters
@@ -87,9 +268,12 @@ class SiteStore:
             int -- ID of updated site 
         """
         if not id in range(len(self.__store)):
-            raise rootError('Cannot find site with ID: %s' % id)
+            raise SiteError('Cannot find site with ID: %s' % id)
 
-        self.__store[id] = {**self.__store[id], **kwargs}
+        self.__unindex(id, self.__store[id])
+        self.__store[id] = self.__store[id].replace(**kwargs)
+        self.__index(id, self.__store[id])
+        self.__config.touch()
         self.__config.save()
         return id
 
@@ -111,9 +295,11 @@ class SiteStore:
             id {int} -- site ID
         """
         if id not in range(len(self.__store)):
-            raise rootError('Cannot find site with ID: %s' % id)
+            raise SiteError('Cannot find site with ID: %s' % id)
 
         del self.__store[id]
+        self.reindex()
+        self.__config.touch()
         self.__config.save()
         return id
 
@@ -130,22 +316,33 @@ class Site:
         root {str} -- site document root (if different from path) (default: {''})
         secure {bool} -- enable SSL/TLS configuration (default: {False})
         id {[type]} -- site ID (for existing sites, should be used alone) (default: {None})
+        store {SiteStore} -- shared site store (default: {None})
+        record {SiteRecord} -- preloaded store record of site ID, skips store lookup (default: {None})
     """
 
-    def __init__(self, config: Config, domain=None, path=None, root='', secure=False, id=None):
+    def __init__(self, config: Config, domain=None, path=None, root='', secure=False, id=None, store=None, record=None):
         self.config = config
-        self.store = SiteStore(config)
+        self.store = store if store is not None else SiteStore(config)
 
         self.__crumbs = {}
+        if record is not None:
+            self.__id = id
+            self.__domain = record.domain
+            self.__path = record.path
+            self.__root = record.root
+            self.__secure = record.secure
+            self.__mirrors = list(record.mirrors)
+            return
+
         path = os.path.abspath(path) if path != None else path
         self.__id, site = self.store.find(id, domain, path)
 
         if self.id != None:
-            self.__domain = site['domain']
-            self.__path = site['path']
-            self.__root = site.get('root', '')
-            self.__secure = site.get('secure', False)
-            self.__mirrors = site.get('mirrors', [])
+            self.__domain = site.domain
+            self.__path = site.path
+            self.__root = site.root
+            self.__secure = site.secure
+            self.__mirrors = list(site.mirrors)
         else:
             self.__domain = domain
             self.__path = path
@@ -176,7 +373,7 @@ class Site:
         Returns:
             list -- list of sites as instance of Host()
         """
-        return [Site(self.config, id=id) for id, site in enumerate(self.store.all())]
+        return [Site(self.config, id=id, store=self.store, record=record) for id, record in self.store.records()]
 
     def toDict(self):
         """Return site data as dictionary
@@ -202,7 +399,7 @@ class Site:
         Returns:
             Site -- new Site instance
         """
-        return Site(self.config, domain, path)
+        return Site(self.config, domain, path, store=self.store)
 
     def save(self, force=False):
         """Save site to store and write configurations
@@ -223,16 +420,20 @@ class Site:
 
         data = self.toDict()
 
-        if self.isDirty() or force:
-            self.removeConfiguration()
-            self.removeDnsEntry()
-            self.removeCertificate()
-            self.__crumbs = {}
-
-        self.store.replace(self.id, **data)
-        self.writeConfiguration()
-        self.writeDnsEntry()
-        self.createCertificate()
+        with Transaction.use(self.config):
+            if self.isDirty() or force:
+                self.removeConfiguration()
+                self.removeDnsEntry()
+                certPath = self.certPath(useCrumbs=self.isDirty())
+                if not self.secure or certPath != self.certPath() or self.certificate.isSelfSigned(certPath):
+                    self.removeCertificate()
+                self.__crumbs = {}
+
+            self.__id = self.store.replace(self.id, **data)
+            self.writeConfiguration()
+            self.writeDnsEntry()
+            self.createCertificate()
+        self.__crumbs = {}
         return True
 
     def exists(self):
@@ -247,9 +448,11 @@ class Site:
         """Get all sites registered to path
 
         Returns:
-            bool
+            list -- list of sites as instance of Site()
         """
-        return [Site(self.config, id=id) for id, site in enumerate(self.store.get(self.path))]
+        if self.path is None:
+            return []
+        return [Site(self.config, id=id, store=self.store, record=record) for id, record in self.store.records(self.path)]
 
     def delete(self):
         """Delete site from store and remove configurations
@@ -261,9 +464,10 @@ class Site:
             return False
 
         self.store.delete(self.id)
-        self.removeConfiguration()
-        self.removeDnsEntry()
-        self.removeCertificate()
+        with Transaction.use(self.config):
+            self.removeConfiguration()
+            self.removeDnsEntry()
+            self.removeCertificate()
         self.__crumbs = {}
         self.__id = None
         return True
@@ -271,9 +475,10 @@ class Site:
     def writeConfiguration(self):
         """Create Apache configuration files for this site"""
         confPath = self.confPath()
-        with open(confPath, 'w+') as f:
-            conf = template(
-                'site.conf',
+        with Transaction.use(self.config) as transaction:
+            transaction.configure(
+                confPath,
+                self.ports(),
                 domain=self.domain,
                 url=self.url(),
                 path=self.documentRoot(),
@@ -283,65 +488,23 @@ class Site:
                 port=self.port(),
                 mirrors=self.mirrors
             )
-            f.write(conf)
-            info(os.path.basename(confPath), title='Configuration Created')
-
-        with open(self.config.get('apache.conf'), 'r+') as f:
-            content = f.read().strip()
-            f.seek(0)
-            f.write(content)
-            f.write('\nInclude "%s"' % confPath)
-            f.truncate()
-            echo('Updated apache configuration file')
+            transaction.include(confPath)
 
     def removeConfiguration(self):
         """Remove Apache configuration files for this site"""
         confPath = self.confPath(useCrumbs=self.isDirty())
-        if os.path.exists(confPath):
-            os.remove(confPath)
-            info(os.path.basename(confPath), title='Deleted')
-
-        with open(self.config.get('apache.conf'), 'r+') as f:
-            removed = []
-            content = []
-            for line in f:
-                if (line.strip() != 'Include "%s"' % confPath):
-                    content.append(line)
-                else:
-                    removed.append(line)
-            f.seek(0)
-            f.write(''.join(content).strip())
-            f.truncate()
-            if removed:
-                echo('Updated apache configuration file')
+        with Transaction.use(self.config) as transaction:
+            transaction.exclude(confPath)
 
     def writeDnsEntry(self):
         """Write DNS entry for this site"""
-        with open(self.config.get('dns.file'), 'r+') as f:
-            content = f.read().strip()
-            f.seek(0)
-            f.write(content)
-            f.write('\n127.0.0.1 %s #VirtualHost' % self.hostName())
-            f.write('\n127.0.0.1 www.%s #VirtualHost' % self.hostName())
-            f.truncate()
-            echo('Updated DNS (hosts) file')
+        with Transaction.use(self.config) as transaction:
+            transaction.syncHosts()
 
     def removeDnsEntry(self):
         """Remove DNS entry for this site"""
-        hostName = self.hostName(useCrumbs=self.isDirty())
-        with open(self.config.get('dns.file'), 'r+') as f:
-            removed = []
-            content = []
-            for line in f:
-                if line.strip() not in ['127.0.0.1 %s #VirtualHost' % hostName, '127.0.0.1 www.%s #VirtualHost' % hostName]:
-                    content.append(line)
-                else:
-                    removed.append(line)
-            f.seek(0)
-            f.write(''.join(content))
-            f.truncate()
-            if removed:
-                echo('Updated DNS (hosts) file')
+        with Transaction.use(self.config) as transaction:
+            transaction.syncHosts()
 
     def createCertificate(self, allowUnsecure=False):
         """Create site certificate files, if secure
@@ -350,16 +513,16 @@ class Site:
             allowUnsecure {bool} -- create certificate regardless of secure property
         """
         if self.secure or allowUnsecure:
-            certPath, keyPath = self.certPath(), self.certKeyPath()
-            self.certificate.create(certPath, keyPath)
-            self.certificate.trust(certPath)
+            with Transaction.use(self.config) as transaction:
+                transaction.certify(self.domain, self.certPath(), self.certKeyPath(), self.certNames())
 
     def removeCertificate(self):
         """Remove site certificate files"""
         certPath, keyPath = self.certPath(
             useCrumbs=self.isDirty()), self.certKeyPath(useCrumbs=self.isDirty())
-        self.certificate.untrust(certPath)
-        self.certificate.delete(certPath, keyPath)
+        with Transaction.use(self.config) as transaction:
+            transaction.untrust(certPath)
+            transaction.uncertify(certPath, keyPath)
 
     def isDirty(self):
         """Check if site properties has been modified
@@ -411,6 +574,22 @@ class Site:
         os.makedirs(os.path.dirname(path), exist_ok=True)
         return path
 
+    def hostEntries(self):
+        """Return DNS (hosts) file entries for this site
+
+        Returns:
+            list
+        """
+        return host_lines(host_names(SiteRecord.fromDict(self.toDict())))
+
+    def certNames(self):
+        """Return host names covered by site certificate
+
+        Returns:
+            list -- domain, www alias and mirrors (without ports)
+        """
+        return host_names(SiteRecord.fromDict(self.toDict()))
+
     def hostName(self, useCrumbs=False, withPort=True):
         """Return site domain name
 
@@ -444,6 +623,15 @@ class Site:
             if port not in [80, 443]:
                 return port
 
+    def ports(self):
+        """Return non-standard ports used by site and its mirrors
+
+        Returns:
+            list
+        """
+        ports = [self.port()] + [parse_host(m)['port'] for m in self.mirrors]
+        return sorted(set(int(p) for p in ports if p and int(p) not in [80, 443]))
+
     def url(self, useCrumbs=False):
         """Return full site url with protocol
 
@@ -467,17 +655,14 @@ class Site:
         """
         root = self.__crumbs.get('root', self.root) if useCrumbs else self.root
         path = self.__crumbs.get('path', self.path) if useCrumbs else self.path
-        if root:
-            return os.path.abspath(os.path.join(path, root))
-        else:
-            return os.path.abspath(path)
+        return document_root(path, root)
 
     def addMirror(self, domain):
-        if self.store.find(domain=domain) != (None, None):
+        if self.store.find(domain=domain) != (None, None) or self.store.findMirror(domain) != (None, None):
             raise SiteExistsError(domain=domain)
         else:
             if not self.__crumbs.get('mirrors'):
-                self.__crumbs['mirrors'] = deepcopy(self.__mirrors)
+                self.__crumbs['mirrors'] = list(self.__mirrors)
             self.__mirrors.append(domain)
 
     def removeMirror(self, domain):
@@ -485,12 +670,12 @@ class Site:
             raise SiteExistsError(domain=domain)
         else:
             if not self.__crumbs.get('mirrors'):
-                self.__crumbs['mirrors'] = deepcopy(self.__mirrors)
+                self.__crumbs['mirrors'] = list(self.__mirrors)
             self.__mirrors.remove(domain)
 
     @property
     def mirrors(self):
-        return deepcopy(self.__mirrors)
+        return list(self.__mirrors)
 
     @property
     def id(self):
@@ -498,7 +683,13 @@ class Site:
 
     @property
     def certificate(self):
-        return Certificate(self.domain)
+        from .certificate import Certificate
+        transaction = Transaction.current()
+        if transaction is not None:
+            return Certificate(self.domain, store=transaction.trust, index=transaction.index)
+
+        from .truststore import trust_store
+        return Certificate(self.domain, store=trust_store(self.config.get('certs.truststore')))
 
     @property
     def domain(self):
@@ -506,7 +697,7 @@ class Site:
 
     @domain.setter
     def domain(self, domain):
-        if self.store.find(domain=domain, ignore=self.id) != (None, None):
+        if self.store.find(domain=domain, ignore=self.id) != (None, None) or self.store.findMirror(domain, ignore=self.id) != (None, None):
             raise SiteExistsError(domain=domain)
         else:
             if not self.__crumbs.get('domain'):
@@ -545,3 +736,20 @@ class Site:
         if not self.__crumbs.get('root'):
             self.__crumbs['root'] = self.root
         self.__root = root
+
+
+def document_root(path, root=''):
+    """Return document root of site
+
+    Arguments:
+        path {str} -- site path
+
+    Keyword Arguments:
+        root {str} -- document root relative to path (default: {''})
+
+    Returns:
+        str
+    """
+    if root:
+        return os.path.abspath(os.path.join(path, root))
+    return os.path.abspath(path)
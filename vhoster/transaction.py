@@ -0,0 +1,362 @@
+from contextlib import contextmanager
+from functools import partial
+import os
+from .bundle import Bundle, config_name
+from .config import Config
+from .helpers import *
+from .hosts import HostsFile
+from .plan import Plan
+
+
+class Transaction:
+    """System File Transaction
+
+    Collects site configurations and Apache include changes across many
+    sites and applies them with a single read-modify-write per file. The
+    managed block of the hosts file is regenerated once from the site store.
+    In bundle mode, only the shard files of changed sites are rewritten.
+    Ports are probed once for all sites and certificates are generated in
+    parallel by a process pool. Pending changes are planned in memory and
+    the plan applied, and configuration saves coalesced, when the outermost
+    block exits. In dry-run mode, the plan is recorded instead. If the block
+    raises, pending changes are discarded.
+
+    Arguments:
+        config {Config} -- configuration instance
+
+    Keyword Arguments:
+        workers {int} -- certificate worker processes, all cores if None (default: {None})
+    """
+
+    __active = []
+
+    def __init__(self, config: Config, workers=None):
+        self.config = config
+        self.workers = workers
+        self.__certificates = None
+        self.__cache = None
+        self.__trust = None
+        self.__index = None
+        self.__untrusted = {}
+        self.__removals = {}
+        self.ports = PortState()
+        self.failures = {}
+        self.bundle = Bundle(config)
+        self.__configs = {}
+        self.__sections = {}
+        self.__includes = {}
+        self.__deletions = set()
+        self.__hosts = False
+
+    def __enter__(self):
+        self.__batch = self.config.batch()
+        self.__batch.__enter__()
+        Transaction.__active.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        Transaction.__active.remove(self)
+        try:
+            if exc_type is None:
+                self.commit()
+            elif self.config.isDirty():
+                # Discard unsaved site changes of the failed block
+                self.config.load()
+        finally:
+            self.__batch.__exit__(None, None, None)
+
+    @property
+    def certificates(self):
+        """Return certificate generation pool
+
+        Returns:
+            CertificatePool
+        """
+        if self.__certificates is None:
+            from .certificate import CertificatePool
+            self.__certificates = CertificatePool(
+                self.workers,
+                store=self.trust,
+                index=self.index,
+                algorithm=self.config.get('certs.algorithm'),
+                poolSize=self.config.get('certs.pool', 8)
+            )
+        return self.__certificates
+
+    @property
+    def trust(self):
+        """Return trusted root certificate store, configured by `certs.truststore`
+
+        Returns:
+            TrustStore
+        """
+        if self.__trust is None:
+            from .truststore import trust_store
+            self.__trust = trust_store(self.config.get('certs.truststore'))
+        return self.__trust
+
+    @property
+    def index(self):
+        """Return certificate fingerprint index, saved on commit
+
+        Returns:
+            CertificateIndex
+        """
+        if self.__index is None:
+            from .certindex import CertificateIndex
+            self.__index = CertificateIndex()
+        return self.__index
+
+    @property
+    def cache(self):
+        """Return certificate reuse cache
+
+        Returns:
+            CertificateCache
+        """
+        if self.__cache is None:
+            from .certificate import CertificateCache
+            self.__cache = CertificateCache(self.config.get('certs.algorithm'))
+        return self.__cache
+
+    @classmethod
+    def current(cls):
+        """Return the innermost active transaction
+
+        Returns:
+            Transaction -- None if no transaction is active
+        """
+        return cls.__active[-1] if cls.__active else None
+
+    @classmethod
+    @contextmanager
+    def use(cls, config: Config):
+        """Join the active transaction or run a new one
+
+        Arguments:
+            config {Config} -- configuration instance
+
+        Yields:
+            Transaction
+        """
+        transaction = cls.current()
+        if transaction is not None:
+            yield transaction
+        else:
+            with cls(config) as transaction:
+                yield transaction
+
+    def configure(self, confPath, ports, **context):
+        """Queue site configuration file for rendering
+
+        Arguments:
+            confPath {str} -- path to site configuration file
+            ports {list} -- non-standard ports used by the site
+            context {dict} -- `site.conf` template substitutions
+        """
+        if not self.bundle.enabled:
+            self.__deletions.discard(confPath)
+        self.__configs[confPath] = (ports, context)
+
+    def include(self, confPath):
+        """Add Include directive to apache configuration file
+
+        In bundle mode, the shard include directive is added instead and
+        the site's own Include line is removed.
+
+        Arguments:
+            confPath {str} -- path to site configuration file
+        """
+        if self.bundle.enabled:
+            self.__includes[self.bundle.include()] = True
+            self.__includes['Include "%s"' % confPath] = False
+        else:
+            self.__includes['Include "%s"' % confPath] = True
+
+    def exclude(self, confPath):
+        """Remove site configuration file and its Include directive (or bundle section)
+
+        Arguments:
+            confPath {str} -- path to site configuration file
+        """
+        self.__configs.pop(confPath, None)
+        self.__deletions.add(confPath)
+        self.__includes['Include "%s"' % confPath] = False
+        if self.bundle.enabled:
+            name = config_name(confPath)
+            self.__sections.setdefault(self.bundle.shardPath(name), {})[name] = None
+
+    def syncHosts(self):
+        """Regenerate managed block of DNS (hosts) file on commit"""
+        self.__hosts = True
+
+    def certify(self, domain, certPath, keyPath, names):
+        """Queue certificate generation for domain, unless existing one can be reused
+
+        Arguments:
+            domain {str} -- domain name
+            certPath {str} -- path to store certificate file (.crt)
+            keyPath {str} -- path to store certificate key (.key)
+            names {list} -- subject alternative names
+        """
+        removed = self.__removals.pop(certPath, None) is not None
+        if removed or not self.cache.valid(certPath, keyPath, names):
+            self.certificates.add(domain, certPath, keyPath, names)
+
+    def untrust(self, certPath):
+        """Queue certificate removal from trusted root certificates, if trusted
+
+        Arguments:
+            certPath {str} -- path to certificate file (.crt)
+        """
+        domain = self.index.find(certPath)
+        if domain is None and os.path.isfile(certPath):
+            from .certificate import Certificate
+            Certificate(config_name(certPath), index=self.index).inspect(certPath)
+            domain = self.index.find(certPath)
+
+        entry = self.index.get(domain) if domain else None
+        if entry and entry.get('trusted'):
+            name = os.path.basename(certPath)
+            self.trust.remove(entry['sha1'], name)
+            self.__untrusted[name] = certPath
+
+    def uncertify(self, certPath, keyPath):
+        """Queue removal of certificate files, unless certificate is generated again
+
+        Arguments:
+            certPath {str} -- path to certificate file (.crt)
+            keyPath {str} -- path to certificate key (.key)
+        """
+        if os.path.isfile(certPath) or os.path.isfile(keyPath):
+            self.__removals[certPath] = keyPath
+
+    def commit(self):
+        """Plan pending changes, then apply them, or add them to the recording plan in dry-run mode
+
+        Returns:
+            Plan
+        """
+        recording = Plan.recording()
+        plan = self.plan(recording if recording is not None else Plan())
+        if recording is None:
+            self.execute(plan)
+        return plan
+
+    def plan(self, plan: Plan):
+        """Compute certificate actions and file changes without touching disk
+
+        Site configurations are rendered, and shard, apache configuration
+        and DNS (hosts) file contents computed, from the contents already
+        planned, so that plans of several transactions can be merged.
+
+        Arguments:
+            plan {Plan} -- plan to add changes to
+
+        Returns:
+            Plan
+        """
+        for certPath in self.__removals:
+            plan.action('Delete Certificate', certPath)
+        if self.__certificates is not None:
+            for domain, (certPath, keyPath, names) in self.__certificates.jobs().items():
+                plan.action('Create Certificate', '%s (%s)' % (certPath, ', '.join(names or [domain])))
+        for name in self.__untrusted:
+            plan.action('Untrust Certificate', name)
+
+        if self.__configs:
+            self.ports.probe(port for ports, context in self.__configs.values() for port in ports)
+            for confPath, (ports, context) in self.__configs.items():
+                content = template('site.conf', listen=self.ports.listen(ports), **context)
+                if self.bundle.enabled:
+                    name = config_name(confPath)
+                    self.__sections.setdefault(self.bundle.shardPath(name), {})[name] = content
+                else:
+                    plan.write(confPath, content, title='Configuration Created')
+            self.__configs = {}
+
+        for confPath in self.__deletions:
+            if plan.read(confPath) is not None:
+                plan.delete(confPath, title='Deleted')
+        self.__deletions = set()
+
+        for shardPath, changes in self.__sections.items():
+            render = partial(self.bundle.render, changes=changes)
+            plan.write(shardPath, render(plan.read(shardPath)), render=render, title='Bundle Updated')
+        self.__sections = {}
+
+        if self.__includes:
+            path, original = self.config.get('apache.conf'), None
+            if path:
+                original = plan.read(path)
+            if original is None:
+                error(path, title='Apache configuration file not found')
+            else:
+                render = partial(self.render, changes=self.__includes, discard=self.bundle.isStale)
+                plan.write(path, render(original), render=render, message='Updated apache configuration file')
+            self.__includes = {}
+
+        if self.__hosts:
+            from .site import SiteStore
+            hosts = HostsFile(self.config.get('dns.file'))
+            render = partial(hosts.render, records=SiteStore(self.config).all())
+            plan.write(hosts.path, render(plan.read(hosts.path) or ''), render=render, message='Updated DNS (hosts) file')
+            self.__hosts = False
+        return plan
+
+    def execute(self, plan: Plan):
+        """Apply certificate actions and file changes of plan
+
+        Arguments:
+            plan {Plan} -- plan computed by plan()
+        """
+        if self.__removals:
+            from .certificate import Certificate
+            for certPath, keyPath in self.__removals.items():
+                Certificate(config_name(certPath), store=self.trust, index=self.index).delete(certPath, keyPath)
+            self.__removals = {}
+
+        if self.__certificates is not None and len(self.__certificates):
+            for domain, err in self.certificates.run().items():
+                if err:
+                    self.failures[domain] = err
+                    error(err, title='Certificate Failed (%s)' % domain)
+
+        if self.__trust is not None and len(self.__trust):
+            for name, err in self.trust.flush().items():
+                if err:
+                    error(err, title='Trust Store Update Failed (%s)' % name)
+                    continue
+                info(name, title='Trust Store Updated')
+                if name in self.__untrusted:
+                    certPath = self.__untrusted[name]
+                    domain = self.index.find(certPath)
+                    self.index.setTrusted(domain, False)
+                    if not os.path.isfile(certPath):
+                        self.index.forget(domain)
+            self.__untrusted = {}
+
+        if self.__index is not None:
+            self.__index.save()
+
+        for change in plan.files.values():
+            if change.apply():
+                change.report()
+
+    def render(self, original, changes: dict, discard=None):
+        """Apply line changes to file content
+
+        Arguments:
+            original {str} -- current content
+            changes {dict} -- {line: True to add, False to remove}
+
+        Keyword Arguments:
+            discard {callable} -- also remove lines matching predicate (default: {None})
+
+        Returns:
+            str -- new content
+        """
+        lines = [line for line in (original or '').splitlines()
+                 if line.strip() not in changes and not (discard and discard(line))]
+        lines.extend(line for line, add in changes.items() if add)
+        return '\n'.join(lines).strip() + '\n'
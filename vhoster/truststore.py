@@ -0,0 +1,318 @@
+import base64, hashlib, json, os, re, shutil, tempfile
+from abc import ABC, abstractmethod
+from .helpers import *
+
+
+class TrustStore(ABC):
+    """Trusted Root Certificate Store
+
+    Backends queue certificates to add and remove, then apply all of them
+    in one batch (a single process spawn at most) when flushed.
+    Certificates are identified by their SHA1 fingerprint.
+    """
+
+    def __init__(self):
+        self.__adds = {}
+        self.__removes = {}
+        self.__names = {}
+
+    def __len__(self):
+        return len(self.__adds) + len(self.__removes)
+
+    def add(self, certPath, name=None):
+        """Queue certificate to be trusted
+
+        Arguments:
+            certPath {str} -- path to certificate file (.crt)
+
+        Keyword Arguments:
+            name {str} -- name used in reports (default: {file name})
+
+        Returns:
+            str -- certificate fingerprint
+        """
+        fingerprint = pem_fingerprint(certPath)
+        self.__removes.pop(fingerprint, None)
+        self.__adds[fingerprint] = os.path.abspath(certPath)
+        self.__names[fingerprint] = name or os.path.basename(certPath)
+        return fingerprint
+
+    def remove(self, fingerprint, name=None):
+        """Queue certificate to be untrusted
+
+        Arguments:
+            fingerprint {str} -- certificate SHA1 fingerprint
+
+        Keyword Arguments:
+            name {str} -- name used in reports (default: {fingerprint})
+        """
+        self.__adds.pop(fingerprint, None)
+        self.__removes[fingerprint] = True
+        self.__names[fingerprint] = name or fingerprint
+
+    def flush(self):
+        """Apply all queued changes
+
+        Returns:
+            dict -- {name: error message, None if successful}
+        """
+        if not len(self):
+            return {}
+
+        adds, removes, names = self.__adds, list(self.__removes), self.__names
+        self.__adds, self.__removes, self.__names = {}, {}, {}
+        try:
+            results = self.apply(adds, removes)
+        except Exception as err:
+            results = {fingerprint: str(err) or err.__class__.__name__ for fingerprint in list(adds) + removes}
+        return {names[fingerprint]: err for fingerprint, err in results.items()}
+
+    def trust(self, certPath, name=None):
+        """Trust single certificate immediately
+
+        Only this certificate is applied, other queued changes are kept
+        for the next flush.
+
+        Arguments:
+            certPath {str} -- path to certificate file (.crt)
+
+        Keyword Arguments:
+            name {str} -- name used in reports (default: {file name})
+
+        Returns:
+            str -- error message, None if successful
+        """
+        fingerprint = pem_fingerprint(certPath)
+        return self.__applyOne(fingerprint, {fingerprint: os.path.abspath(certPath)}, [])
+
+    def untrust(self, fingerprint, name=None):
+        """Untrust single certificate immediately
+
+        Only this certificate is applied, other queued changes are kept
+        for the next flush.
+
+        Arguments:
+            fingerprint {str} -- certificate SHA1 fingerprint
+
+        Keyword Arguments:
+            name {str} -- name used in reports (default: {fingerprint})
+
+        Returns:
+            str -- error message, None if successful
+        """
+        return self.__applyOne(fingerprint, {}, [fingerprint])
+
+    def __applyOne(self, fingerprint, adds, removes):
+        """Apply change of a single certificate, dropping queued changes of it
+
+        Returns:
+            str -- error message, None if successful
+        """
+        self.__adds.pop(fingerprint, None)
+        self.__removes.pop(fingerprint, None)
+        self.__names.pop(fingerprint, None)
+        try:
+            return self.apply(adds, removes).get(fingerprint)
+        except Exception as err:
+            return str(err) or err.__class__.__name__
+
+    @abstractmethod
+    def apply(self, adds, removes):
+        """Apply changes to the underlying store
+
+        Arguments:
+            adds {dict} -- {fingerprint: path to certificate file}
+            removes {list} -- fingerprints
+
+        Returns:
+            dict -- {fingerprint: error message, None if successful}
+        """
+
+
+class WindowsTrustStore(TrustStore):
+    """Windows Root Certificate Store
+
+    Changes are applied to the local machine `Root` store by a single
+    PowerShell invocation. The script is run from a temporary file, as
+    bulk changes exceed the command line length limit.
+    """
+
+    def apply(self, adds, removes):
+        lines = [
+            "$store = New-Object System.Security.Cryptography.X509Certificates.X509Store('Root', 'LocalMachine')",
+            "$store.Open('ReadWrite')"
+        ]
+        for fingerprint, certPath in adds.items():
+            lines.append("try { $store.Add((New-Object System.Security.Cryptography.X509Certificates.X509Certificate2(%s))); "
+                         "Write-Output 'ok %s' } catch { Write-Output ('fail %s ' + $_.Exception.Message) }" % (
+                             ps_quote(certPath), fingerprint, fingerprint))
+        for fingerprint in removes:
+            lines.append("try { $store.Certificates.Find('FindByThumbprint', %s, $false) | ForEach-Object { $store.Remove($_) }; "
+                         "Write-Output 'ok %s' } catch { Write-Output ('fail %s ' + $_.Exception.Message) }" % (
+                             ps_quote(fingerprint.replace(':', '')), fingerprint, fingerprint))
+        lines.append("$store.Close()")
+
+        fd, script = tempfile.mkstemp(prefix='vhoster-', suffix='.ps1')
+        try:
+            # BOM makes Windows PowerShell read non-ASCII paths as UTF-8
+            with os.fdopen(fd, 'w', encoding='utf-8-sig') as f:
+                f.write('\n'.join(lines))
+            command = run_command(['powershell', '-NoProfile', '-NonInteractive', '-ExecutionPolicy', 'Bypass',
+                                   '-File', script], True, timeout=120)
+        finally:
+            os.remove(script)
+
+        fingerprints = list(adds) + list(removes)
+        results = {fingerprint: command['errors'].strip() or 'Trust store update failed' for fingerprint in fingerprints}
+        for line in command['output'].splitlines():
+            parts = line.strip().split(' ', 2)
+            if len(parts) >= 2 and parts[1] in results:
+                results[parts[1]] = None if parts[0] == 'ok' else (parts[2] if len(parts) > 2 else 'Failed')
+        return results
+
+
+class LinuxTrustStore(TrustStore):
+    """Linux System Trust Anchors
+
+    Certificates are copied to (or removed from) the system anchors
+    directory, then the trust bundle is refreshed once.
+
+    Keyword Arguments:
+        anchors {str} -- anchors directory (default: {detected})
+        refresh {list} -- trust refresh command (default: {detected})
+    """
+
+    LAYOUTS = [
+        ('/usr/local/share/ca-certificates', ['update-ca-certificates']),
+        ('/etc/pki/ca-trust/source/anchors', ['update-ca-trust', 'extract']),
+        ('/etc/ca-certificates/trust-source/anchors', ['trust', 'extract-compat'])
+    ]
+
+    def __init__(self, anchors=None, refresh=None):
+        super().__init__()
+        if anchors is None:
+            anchors, refresh = next(((a, r) for a, r in self.LAYOUTS if os.path.isdir(a)), self.LAYOUTS[0])
+        self.anchors = anchors
+        self.refresh = refresh
+
+    def anchorPath(self, fingerprint):
+        """Return path to anchor file of certificate
+
+        Arguments:
+            fingerprint {str} -- certificate SHA1 fingerprint
+
+        Returns:
+            str
+        """
+        return os.path.join(self.anchors, 'vhoster-%s.crt' % fingerprint.replace(':', '').lower())
+
+    def apply(self, adds, removes):
+        results = {}
+        for fingerprint, certPath in adds.items():
+            try:
+                os.makedirs(self.anchors, exist_ok=True)
+                shutil.copyfile(certPath, self.anchorPath(fingerprint))
+                results[fingerprint] = None
+            except OSError as err:
+                results[fingerprint] = str(err)
+        for fingerprint in removes:
+            try:
+                if os.path.exists(self.anchorPath(fingerprint)):
+                    os.remove(self.anchorPath(fingerprint))
+                results[fingerprint] = None
+            except OSError as err:
+                results[fingerprint] = str(err)
+
+        if self.refresh and any(err is None for err in results.values()):
+            command = run_command(self.refresh, True, timeout=120)
+            if command['returncode'] != 0:
+                message = (command['errors'] or command['output']).strip() or 'Trust store refresh failed'
+                results = {fingerprint: err or message for fingerprint, err in results.items()}
+        return results
+
+
+class FileTrustStore(TrustStore):
+    """File Based Trust Store
+
+    Records trusted certificates in a JSON file without touching the
+    system, for tests and sandboxed environments.
+
+    Keyword Arguments:
+        path {str} -- path to store file (default: {app_data('certs', 'truststore.json')})
+    """
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path or app_data('certs', 'truststore.json')
+
+    def fingerprints(self):
+        """Return trusted certificates
+
+        Returns:
+            dict -- {fingerprint: path to certificate file}
+        """
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def apply(self, adds, removes):
+        trusted = self.fingerprints()
+        trusted.update(adds)
+        for fingerprint in removes:
+            trusted.pop(fingerprint, None)
+        atomic_write(self.path, json.dumps(trusted, indent=4, sort_keys=True))
+        return {fingerprint: None for fingerprint in list(adds) + list(removes)}
+
+
+BACKENDS = {
+    'windows': WindowsTrustStore,
+    'linux': LinuxTrustStore,
+    'file': FileTrustStore
+}
+
+
+def trust_store(backend=None):
+    """Create trust store backend
+
+    Keyword Arguments:
+        backend {str} -- backend name, detected from the OS if empty (default: {None})
+
+    Returns:
+        TrustStore
+    """
+    if not backend:
+        backend = 'windows' if is_os('Windows') else 'linux'
+    if backend not in BACKENDS:
+        raise ValueError('Unknown trust store backend: %s' % backend)
+    return BACKENDS[backend]()
+
+
+def pem_fingerprint(certPath):
+    """Return SHA1 fingerprint of PEM certificate without parsing it
+
+    Arguments:
+        certPath {str} -- path to certificate file (.crt)
+
+    Returns:
+        str -- colon separated, upper case hex digest
+    """
+    with open(certPath, 'r') as f:
+        match = re.search(r'-----BEGIN CERTIFICATE-----(.+?)-----END CERTIFICATE-----', f.read(), re.S)
+    if match is None:
+        raise ValueError('Invalid certificate file: %s' % certPath)
+    digest = hashlib.sha1(base64.b64decode(''.join(match.group(1).split()))).hexdigest()
+    return ':'.join(digest[i:i + 2] for i in range(0, len(digest), 2)).upper()
+
+
+def ps_quote(value):
+    """Quote string for PowerShell
+
+    Arguments:
+        value {str}
+
+    Returns:
+        str
+    """
+    return "'%s'" % value.replace("'", "''")
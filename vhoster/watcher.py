@@ -0,0 +1,405 @@
+import os, time
+from .helpers import *
+from .config import Config
+from .site import Site, SiteStore, document_root
+from .server import Server
+from .transaction import Transaction
+from .errors import SiteError
+
+
+class PollingWatcher:
+    """Directory Watcher Using Polling
+
+    Directories are compared by inode and modification time, which change
+    whenever an entry is created, deleted or renamed inside them.
+
+    Keyword Arguments:
+        interval {float} -- seconds between scans (default: {1.0})
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.__stamps = {}
+
+    def __len__(self):
+        return len(self.__stamps)
+
+    def watch(self, directories):
+        """Replace watched directories
+
+        Arguments:
+            directories {iterable} -- directory paths
+        """
+        directories = set(directories)
+        self.__stamps = {d: self.__stamps[d] if d in self.__stamps else directory_stamp(d) for d in directories}
+
+    def wait(self, timeout=None):
+        """Wait for changes
+
+        Keyword Arguments:
+            timeout {float} -- maximum seconds to wait, forever if None (default: {None})
+
+        Returns:
+            set -- changed directories, empty on timeout
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            time.sleep(self.interval if deadline is None else max(0, min(self.interval, deadline - time.time())))
+            changed = set()
+            for directory, stamp in self.__stamps.items():
+                current = directory_stamp(directory)
+                if current != stamp:
+                    self.__stamps[directory] = current
+                    changed.add(directory)
+            if changed or (deadline is not None and time.time() >= deadline):
+                return changed
+
+    def close(self):
+        self.__stamps = {}
+
+
+class InotifyWatcher:
+    """Directory Watcher Using Linux inotify
+
+    All directories share a single inotify descriptor, so thousands of
+    them are watched without threads. Only entries being created, deleted
+    or renamed are reported.
+    """
+
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+
+    MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+    def __init__(self):
+        import ctypes, ctypes.util
+        self.__libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.__fd = self.__libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.__watches = {}
+        self.__paths = {}
+
+    def __len__(self):
+        return len(self.__paths)
+
+    def watch(self, directories):
+        """Replace watched directories
+
+        Missing directories are skipped.
+
+        Arguments:
+            directories {iterable} -- directory paths
+
+        Raises:
+            OSError: Watch limit reached
+        """
+        import ctypes, errno
+        directories = set(directories)
+        for directory in set(self.__paths) - directories:
+            self.__libc.inotify_rm_watch(self.__fd, self.__paths.pop(directory))
+        for directory in directories - set(self.__paths):
+            wd = self.__libc.inotify_add_watch(self.__fd, os.fsencode(directory), self.MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                if code in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                    continue
+                raise OSError(code, os.strerror(code), directory)
+            self.__paths[directory] = wd
+            self.__watches[wd] = directory
+
+    def wait(self, timeout=None):
+        """Wait for changes
+
+        Keyword Arguments:
+            timeout {float} -- maximum seconds to wait, forever if None (default: {None})
+
+        Returns:
+            set -- changed directories, empty on timeout
+        """
+        import select, struct
+        if not select.select([self.__fd], [], [], timeout)[0]:
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.__fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = struct.unpack_from('iIII', data, offset)
+                offset += 16 + length
+                if mask & self.IN_Q_OVERFLOW:
+                    changed.update(self.__paths)
+                    continue
+                directory = self.__watches.get(wd)
+                if directory is None:
+                    continue
+                changed.add(directory)
+                if mask & self.IN_IGNORED:
+                    del self.__watches[wd]
+                    if self.__paths.get(directory) == wd:
+                        del self.__paths[directory]
+        return changed
+
+    def close(self):
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
+        self.__watches, self.__paths = {}, {}
+
+
+class SiteWatcher:
+    """Site Directory Watcher
+
+    Watches the directories that decide where each site is served from:
+    the parent of the site path and every directory down to its document
+    root. Changes are debounced, then only affected sites are refreshed in
+    a single transaction followed by one Apache reload. Sites whose
+    directory was renamed within the same parent are moved to the new path.
+    Sites whose document root is missing are reported and refreshed once it
+    appears.
+
+    Arguments:
+        config {Config} -- configuration instance
+
+    Keyword Arguments:
+        watcher {InotifyWatcher|PollingWatcher} -- directory watcher (default: {create_watcher()})
+        debounce {float} -- seconds without changes before sites are refreshed (default: {0.5})
+    """
+
+    def __init__(self, config: Config, watcher=None, debounce=0.5):
+        self.config = config
+        self.watcher = watcher if watcher is not None else create_watcher()
+        self.debounce = debounce
+        self.store = None
+        self.__targets = {}
+        self.__states = {}
+        self.sync()
+
+    def sync(self):
+        """Reload configuration if changed and watch directories of new or changed sites"""
+        self.config.acquire(shared=True).release()
+        if self.store is not None and self.store.isCurrent():
+            return
+
+        self.store = SiteStore(self.config)
+        states = {}
+        for record in self.store.all():
+            state = self.__states.get(record.domain)
+            if state is None:
+                state = site_state(record.path, record.root)
+                if state[0] is not None and not state[1]:
+                    warn(document_root(record.path, record.root), title='Document root missing')
+            states[record.domain] = state
+        self.__states = states
+        self.rewatch()
+
+    def rewatch(self):
+        """Update watched directories from site paths and document roots"""
+        self.__targets = {}
+        for record in self.store.all():
+            for directory in watched_directories(record.path, record.root):
+                self.__targets.setdefault(directory, set()).add(record.domain)
+
+        try:
+            self.watcher.watch(self.__targets)
+        except OSError as err:
+            if isinstance(self.watcher, PollingWatcher):
+                raise
+            warn('%s, falling back to polling' % err.strerror, title='Watch limit reached')
+            self.watcher.close()
+            self.watcher = PollingWatcher()
+            self.watcher.watch(self.__targets)
+
+    def run(self):
+        """Watch and refresh sites until interrupted"""
+        pending, deadline = set(), None
+        while True:
+            changed = self.watcher.wait(1.0 if deadline is None else max(0, deadline - time.time()))
+            if changed:
+                pending |= changed
+                deadline = time.time() + self.debounce
+            elif deadline is not None and time.time() >= deadline:
+                self.refresh(pending)
+                pending, deadline = set(), None
+            elif deadline is None:
+                self.sync()
+
+    def refresh(self, directories):
+        """Refresh sites affected by changed directories
+
+        Arguments:
+            directories {set} -- changed directories
+
+        Returns:
+            int -- number of refreshed sites
+        """
+        self.sync()
+        domains = set()
+        for directory in directories:
+            domains |= self.__targets.get(directory, set())
+
+        updates = []
+        with self.config.locked():
+            for id, record in self.store.records():
+                if record.domain not in domains:
+                    continue
+                state = site_state(record.path, record.root)
+                previous = self.__states.get(record.domain)
+                if state == previous:
+                    continue
+                self.__states[record.domain] = state
+                moved = None
+                if state[0] is None:
+                    if previous is not None and previous[0] is not None:
+                        moved = find_moved(previous[0], [os.path.dirname(record.path)] + sorted(directories))
+                    if moved is None:
+                        warn(record.path, title='Site path missing')
+                        continue
+                elif not state[1]:
+                    warn(document_root(record.path, record.root), title='Document root missing')
+                    continue
+                updates.append((Site(self.config, id=id, store=self.store, record=record), moved))
+
+            if updates:
+                with Transaction(self.config):
+                    for site, moved in updates:
+                        try:
+                            if moved is not None:
+                                warn('%s -> %s' % (site.path, moved), title='Moved')
+                                site.path = moved
+                                site.save()
+                                self.__states[site.domain] = site_state(site.path, site.root)
+                            else:
+                                warn(site.domain, title='Refreshing')
+                                site.save(force=True)
+                        except SiteError as err:
+                            error(err, title=site.domain)
+
+        if updates:
+            self.rewatch()
+            Server(self.config).reload()
+        return len(updates)
+
+    def close(self):
+        self.watcher.close()
+
+
+def create_watcher(polling=False, interval=1.0):
+    """Create directory watcher, using inotify where available
+
+    Keyword Arguments:
+        polling {bool} -- force polling (default: {False})
+        interval {float} -- polling interval in seconds (default: {1.0})
+
+    Returns:
+        InotifyWatcher|PollingWatcher
+    """
+    if not polling and is_os('Linux'):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(interval)
+
+
+def watched_directories(path, root=''):
+    """Return directories whose entries decide where a site is served from
+
+    Arguments:
+        path {str} -- site path
+
+    Keyword Arguments:
+        root {str} -- document root relative to path (default: {''})
+
+    Returns:
+        list
+    """
+    path = os.path.abspath(path)
+    target = os.path.abspath(os.path.join(path, root)) if root else path
+    directories = [os.path.dirname(path)]
+    try:
+        relative = os.path.relpath(target, path)
+    except ValueError:
+        relative = target
+    if relative == os.curdir:
+        return directories
+    if os.path.isabs(relative) or relative.split(os.sep)[0] == os.pardir:
+        return directories + [os.path.dirname(target)]
+
+    for part in relative.split(os.sep):
+        directories.append(path)
+        path = os.path.join(path, part)
+    return directories
+
+
+def site_state(path, root=''):
+    """Return identity of site path and whether its document root exists
+
+    Arguments:
+        path {str} -- site path
+
+    Keyword Arguments:
+        root {str} -- document root relative to path (default: {''})
+
+    Returns:
+        tuple -- ((device, inode) or None if missing, document root exists)
+    """
+    try:
+        stat = os.stat(path)
+        identity = (stat.st_dev, stat.st_ino)
+    except OSError:
+        identity = None
+    return identity, os.path.isdir(document_root(path, root))
+
+
+def find_moved(identity, directories):
+    """Find directory with given identity among entries of directories
+
+    Arguments:
+        identity {tuple} -- (device, inode)
+        directories {list} -- directories to search
+
+    Returns:
+        str -- None if not found
+    """
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stat = os.stat(entry.path)
+                    if (stat.st_dev, stat.st_ino) == identity:
+                        return entry.path
+            except OSError:
+                continue
+    return None
+
+
+def directory_stamp(path):
+    """Return inode and modification time of directory
+
+    Arguments:
+        path {str}
+
+    Returns:
+        tuple -- None if missing
+    """
+    try:
+        stat = os.stat(path)
+        return stat.st_ino, stat.st_mtime_ns
+    except OSError:
+        return None